@@ -6,17 +6,26 @@ Command Agent - コマンド実行エージェント
 """
 
 import os
+import re
+import atexit
 import sys
 import subprocess
 import json
 import asyncio
+import concurrent.futures
 import time
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union, Tuple
-from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Any, Union, Tuple
+from dataclasses import dataclass, field
+from collections import deque
+from itertools import islice
+import select
 import shlex
 import signal
 import threading
+import uuid
+import weakref
 
 # プロジェクトパスを追加
 project_root = Path(__file__).parent.parent
@@ -25,8 +34,27 @@ sys.path.insert(0, str(project_root))
 from services.db.llm_history_manager import LLMHistoryManager
 from agents.llm_agent import LLMAgent
 
+# Windows/Unixパスパターン（出力分析用）
+_PATH_RE = re.compile(
+    r'[a-zA-Z]:\\[\w\\.-]+'  # Windows絶対パス
+    r'|/[\w/.-]+'            # Unix絶対パス
+    r'|\.[\w/.-]+'           # 相対パス
+    r'|~[\w/.-]*'            # ホームパス
+)
 
-@dataclass
+# テーブル列区切り文字 / リストマーカー
+_TABLE_SEPARATORS = ('\t', '|', '  +')
+_LIST_MARKERS = ('-', '*', '+', '•')
+
+# エラー出力の分類キーワード
+_NETWORK_ERROR_KEYWORDS = frozenset({"connection", "network", "timeout", "unreachable"})
+_ERROR_KEYWORD_RE = re.compile(
+    r"permission denied|not found|syntax error|connection|network|timeout|unreachable",
+    re.IGNORECASE
+)
+
+
+@dataclass(slots=True)
 class CommandResult:
     """コマンド実行結果"""
     command: str
@@ -37,9 +65,19 @@ class CommandResult:
     timestamp: float
     pid: Optional[int] = None
     signal_used: Optional[int] = None
+    truncated: bool = False  # 出力がバッファ上限を超え、先頭が切り捨てられた
+    # analyze_command_output の結果キャッシュ
+    analysis: Optional[Dict[str, Any]] = field(default=None, repr=False, compare=False)
+    # 履歴表示用フラグ（生成時に確定）
+    has_output: bool = field(init=False, repr=False, compare=False)
+    has_errors: bool = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.has_output = bool(self.stdout)
+        self.has_errors = bool(self.stderr)
 
 
-@dataclass
+@dataclass(slots=True)
 class CommandConfig:
     """コマンド設定"""
     timeout: int = 30
@@ -48,6 +86,19 @@ class CommandConfig:
     working_dir: Optional[str] = None
     env_vars: Optional[Dict[str, str]] = None
     safe_mode: bool = True
+    persistent_shell: bool = False  # 常駐シェルでコマンドを実行（POSIXのみ）
+
+
+# 未書き込みのコマンドログを持ちうるエージェント（終了時にまとめてフラッシュ）
+# WeakSet なので登録してもインスタンスの寿命は延びない
+_LOG_AGENTS: "weakref.WeakSet[CommandAgent]" = weakref.WeakSet()
+
+
+@atexit.register
+def _flush_all_logs():
+    """プロセス終了時に全エージェントのバッファ済みログを書き込む"""
+    for agent in list(_LOG_AGENTS):
+        agent.flush_logs()
 
 
 class CommandAgent:
@@ -70,14 +121,36 @@ class CommandAgent:
         r'mount.*umount'
     ]
 
+    # 危険パターンを1本の正規表現に事前コンパイル（グループ番号 = パターン番号）
+    _DANGEROUS_RE = re.compile("|".join(f"({p})" for p in DANGEROUS_PATTERNS), re.IGNORECASE)
+
     # 許可されたコマンド（セーフモード）
-    SAFE_COMMANDS = [
+    SAFE_COMMANDS = frozenset({
         'ls', 'dir', 'pwd', 'cd', 'cat', 'type', 'echo', 'find', 'grep',
         'git', 'python', 'pip', 'npm', 'node', 'curl', 'wget',
         'ps', 'top', 'netstat', 'ping', 'tracert', 'nslookup',
         'head', 'tail', 'wc', 'sort', 'uniq', 'cut', 'awk', 'sed',
         'cp', 'copy', 'mv', 'move', 'mkdir', 'touch', 'which', 'where'
-    ]
+    })
+
+    # コマンドログのバッチ書き込み（件数 / 秒）
+    LOG_BATCH_SIZE = 50
+    LOG_FLUSH_INTERVAL = 2.0
+
+    # 対話モードの終了コマンド
+    EXIT_COMMANDS = frozenset({'exit', 'quit', 'q'})
+
+    # 保持するコマンド履歴の上限件数
+    HISTORY_MAXLEN = 10000
+
+    # 未確認のまま保持するバックグラウンド実行結果の上限件数（超過分は古い順に破棄）
+    COMPLETED_MAXLEN = 100
+
+    # 保持するstdout/stderrの上限バイト数（超過分は先頭から破棄）
+    OUTPUT_BUFFER_LIMIT = 1024 * 1024
+
+    # JSON判定を行う出力サイズの上限（バイト数ではなく文字数）
+    JSON_SNIFF_LIMIT = 1_000_000
 
     def __init__(self):
         self.project_root = project_root
@@ -85,62 +158,111 @@ class CommandAgent:
         self.llm_agent = LLMAgent()
 
         # 実行中プロセス管理
-        self.running_processes: Dict[str, subprocess.Popen] = {}
-        self.command_history: List[CommandResult] = []
+        # キーはOSのPID（実行中のプロセス間で一意）
+        self.running_processes: Dict[int, asyncio.subprocess.Process] = {}
+        self.completed_processes: Dict[int, Dict[str, Any]] = {}
+        self._background_tasks: Dict[int, concurrent.futures.Future] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.command_history: Deque[CommandResult] = deque(maxlen=self.HISTORY_MAXLEN)
 
         # デフォルト設定
         self.default_config = CommandConfig()
 
+        # コマンドログのバッファと書き込みスレッド
+        # （スレッドは最初のログで起動し、バッファが空になったら終了する）
+        self._log_buffer: Deque[Dict[str, Any]] = deque()
+        self._log_event = threading.Event()
+        self._log_lock = threading.Lock()
+        self._log_thread: Optional[threading.Thread] = None
+        _LOG_AGENTS.add(self)
+
+        # 対話モードの組み込みコマンド
+        self._commands = {
+            'help': self._show_help,
+            'history': self._show_history,
+            'status': self._show_status
+        }
+        self._prefix_commands = (
+            ('kill ', self._handle_kill),
+            ('async ', self._handle_async)
+        )
+
+        # 環境変数スナップショット（コマンドごとのコピーを避ける）
+        self._base_env = dict(os.environ)
+
         # プラットフォーム検出
         self.is_windows = os.name == 'nt'
         self.shell_command = 'powershell.exe' if self.is_windows else '/bin/bash'
 
-    def is_safe_command(self, command: str) -> Tuple[bool, str]:
-        """コマンドの安全性チェック"""
-        import re
+        # 常駐シェル（persistent_shell 有効時のみ起動）
+        self._persistent_shell: Optional[subprocess.Popen] = None
+        self._shell_lock = threading.Lock()
+
+    def is_safe_command(self, command: str, config: Optional[CommandConfig] = None) -> Tuple[bool, str]:
+        """コマンドの安全性チェック（config 省略時はデフォルト設定を使用）"""
 
         # 危険パターンチェック
-        for pattern in self.DANGEROUS_PATTERNS:
-            if re.search(pattern, command, re.IGNORECASE):
-                return False, f"危険なパターンを検出: {pattern}"
+        match = self._DANGEROUS_RE.search(command)
+        if match:
+            return False, f"危険なパターンを検出: {self.DANGEROUS_PATTERNS[match.lastindex - 1]}"
 
-        # セーフモードの場合、許可コマンドのみ
-        if self.default_config.safe_mode:
-            command_parts = shlex.split(command) if not self.is_windows else command.split()
-            if command_parts:
-                base_command = command_parts[0].lower()
-                # パスを除去してコマンド名のみ取得
-                base_command = os.path.basename(base_command).replace('.exe', '')
+        # セーフモード無効時はトークン解析を行わない
+        if not (config or self.default_config).safe_mode:
+            return True, "安全"
 
-                if base_command not in self.SAFE_COMMANDS:
-                    return False, f"セーフモードで許可されていないコマンド: {base_command}"
+        # セーフモードの場合、許可コマンドのみ
+        first_token = self._first_token(command)
+        if first_token:
+            base_command = first_token.lower()
+            # パスを除去してコマンド名のみ取得（区切り文字がある場合のみ）
+            if '/' in base_command or '\\' in base_command:
+                base_command = os.path.basename(base_command)
+            if base_command.endswith('.exe'):
+                base_command = base_command[:-4]
+
+            if base_command not in self.SAFE_COMMANDS:
+                return False, f"セーフモードで許可されていないコマンド: {base_command}"
 
         return True, "安全"
 
-    def prepare_command(self, command: str, config: CommandConfig) -> Tuple[str, Dict[str, Any]]:
-        """コマンド実行準備"""
+    def _first_token(self, command: str) -> Optional[str]:
+        """コマンド先頭のトークンを取得（引用符で始まる場合のみshlexで解析）"""
+        stripped = command.lstrip()
+        if not stripped:
+            return None
+
+        if not self.is_windows and stripped[0] in '\'"':
+            command_parts = shlex.split(stripped)
+            return command_parts[0] if command_parts else None
+
+        return stripped.split(None, 1)[0]
 
-        # 環境変数準備
-        env = os.environ.copy()
-        if config.env_vars:
-            env.update(config.env_vars)
+    def prepare_command(self, command: str, config: CommandConfig) -> Tuple[Union[str, List[str]], Dict[str, Any]]:
+        """コマンド実行準備
+
+        シェル経由の場合も /bin/sh を挟まず、シェル本体を argv で直接起動する。
+        """
+
+        # 環境変数準備（追加指定がある場合のみコピー）
+        env = self._base_env if not config.env_vars else {**self._base_env, **config.env_vars}
 
         # 作業ディレクトリ設定
         cwd = config.working_dir or str(self.project_root)
 
         # プラットフォーム別コマンド調整
         if self.is_windows:
-            if config.shell:
+            if config.shell and not command.startswith('powershell'):
                 # PowerShellコマンドラッピング
-                if not command.startswith('powershell'):
-                    command = f'powershell.exe -Command "{command}"'
+                argv = [self.shell_command, '-Command', command]
+            else:
+                # Windowsはコマンドライン文字列をそのまま CreateProcess に渡せる
+                argv = command
         else:
-            if config.shell and not command.startswith('/bin/'):
-                command = f'/bin/bash -c "{command}"'
+            argv = [self.shell_command, '-c', command] if config.shell else shlex.split(command)
 
         # subprocess引数
         kwargs = {
-            'shell': config.shell,
+            'shell': False,
             'cwd': cwd,
             'env': env,
             'timeout': config.timeout
@@ -155,7 +277,7 @@ class CommandAgent:
                 'errors': 'replace'
             })
 
-        return command, kwargs
+        return argv, kwargs
 
     def execute_command(self, command: str, config: Optional[CommandConfig] = None) -> CommandResult:
         """コマンド実行"""
@@ -166,7 +288,7 @@ class CommandAgent:
         start_time = time.time()
 
         # 安全性チェック
-        is_safe, safety_msg = self.is_safe_command(command)
+        is_safe, safety_msg = self.is_safe_command(command, config)
         if not is_safe:
             return CommandResult(
                 command=command,
@@ -186,18 +308,37 @@ class CommandAgent:
                 print(f"   作業ディレクトリ: {config.working_dir}")
 
             # 実行
-            process = subprocess.run(prepared_command, **kwargs)
+            if config.persistent_shell and config.shell and not self.is_windows:
+                exit_code, stdout, stderr, truncated, pid = self._run_in_persistent_shell(command, config)
+            elif config.capture_output:
+                future = asyncio.run_coroutine_threadsafe(
+                    self._run_streaming(prepared_command, kwargs), self._get_event_loop()
+                )
+                try:
+                    exit_code, stdout, stderr, truncated, pid = future.result()
+                except KeyboardInterrupt:
+                    # 中断時は実行中のプロセスグループも停止
+                    future.cancel()
+                    raise
+            else:
+                process = subprocess.run(prepared_command, **kwargs)
+                exit_code = process.returncode
+                stdout = process.stdout
+                stderr = process.stderr
+                truncated = False
+                pid = process.pid if hasattr(process, 'pid') else None
 
             duration = time.time() - start_time
 
             result = CommandResult(
                 command=command,
-                exit_code=process.returncode,
-                stdout=process.stdout or "",
-                stderr=process.stderr or "",
+                exit_code=exit_code,
+                stdout=stdout or "",
+                stderr=stderr or "",
                 duration=duration,
                 timestamp=start_time,
-                pid=process.pid if hasattr(process, 'pid') else None
+                pid=pid,
+                truncated=truncated
             )
 
             # 履歴に追加
@@ -234,14 +375,215 @@ class CommandAgent:
             self.command_history.append(result)
             return result
 
+    def _get_persistent_shell(self) -> subprocess.Popen:
+        """常駐シェル取得（未起動または終了済みなら起動）"""
+        shell = self._persistent_shell
+        if shell is None or shell.poll() is not None:
+            shell = subprocess.Popen(
+                [self.shell_command],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                cwd=str(self.project_root),
+                start_new_session=True
+            )
+            self._persistent_shell = shell
+        return shell
+
+    def _run_in_persistent_shell(self, command: str, config: CommandConfig) -> Tuple[int, str, str, bool, int]:
+        """常駐シェルでコマンド実行し (exit_code, stdout, stderr, truncated, pid) を返す
+
+        コマンドはサブシェル内で実行するため、cd や変数設定は次のコマンドに持ち越さない。
+        終了はランダムなセンチネル行で検出する。
+        出力は _run_streaming と同じく末尾 OUTPUT_BUFFER_LIMIT バイトのみ保持する。
+        """
+        with self._shell_lock:
+            shell = self._get_persistent_shell()
+            marker = f"__NH_END_{uuid.uuid4().hex}__"
+            cwd = config.working_dir or str(self.project_root)
+            exports = "".join(
+                f"export {key}={shlex.quote(value)}; "
+                for key, value in (config.env_vars or {}).items()
+            )
+            script = (
+                f"( cd {shlex.quote(cwd)} || exit 1; {exports}{command}\n) </dev/null; "
+                f"printf '\\n{marker}%d\\n' $?; printf '\\n{marker}\\n' >&2\n"
+            )
+            shell.stdin.write(script.encode('utf-8'))
+            shell.stdin.flush()
+
+            marker_bytes = marker.encode('ascii')
+            buffers = {shell.stdout.fileno(): bytearray(), shell.stderr.fileno(): bytearray()}
+            marker_pos = {fd: -1 for fd in buffers}
+            truncated = False
+            # センチネル検出用に、上限に加えてセンチネル行分だけ余分に残す
+            keep = self.OUTPUT_BUFFER_LIMIT + len(marker_bytes) + 1
+            pending = set(buffers)
+            deadline = time.monotonic() + config.timeout
+
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.close_persistent_shell()
+                    raise subprocess.TimeoutExpired(command, config.timeout)
+
+                readable, _, _ = select.select(list(pending), [], [], remaining)
+                for fd in readable:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        self.close_persistent_shell()
+                        raise RuntimeError("常駐シェルが予期せず終了しました")
+                    buf = buffers[fd]
+                    buf += chunk
+                    # 新しく読んだ範囲だけを走査してセンチネル行の完了を確認
+                    if marker_pos[fd] < 0:
+                        marker_pos[fd] = buf.find(marker_bytes, max(0, len(buf) - len(chunk) - len(marker_bytes)))
+                    if marker_pos[fd] < 0 and len(buf) > keep:
+                        # 上限超過分を先頭から破棄
+                        del buf[:len(buf) - keep]
+                        truncated = True
+                    if marker_pos[fd] >= 0 and buf.find(b"\n", marker_pos[fd]) >= 0:
+                        pending.discard(fd)
+
+            out_fd, err_fd = shell.stdout.fileno(), shell.stderr.fileno()
+            out_buf, err_buf = buffers[out_fd], buffers[err_fd]
+            out_idx, err_idx = marker_pos[out_fd], marker_pos[err_fd]
+            exit_code = int(out_buf[out_idx + len(marker_bytes):].strip())
+
+            # センチネル直前に付加した改行を除去し、末尾 OUTPUT_BUFFER_LIMIT バイトに揃える
+            out_data, err_data = out_buf[:out_idx - 1], err_buf[:err_idx - 1]
+            if len(out_data) > self.OUTPUT_BUFFER_LIMIT or len(err_data) > self.OUTPUT_BUFFER_LIMIT:
+                truncated = True
+                out_data = out_data[-self.OUTPUT_BUFFER_LIMIT:]
+                err_data = err_data[-self.OUTPUT_BUFFER_LIMIT:]
+            stdout = out_data.decode('utf-8', errors='replace')
+            stderr = err_data.decode('utf-8', errors='replace')
+            return exit_code, stdout, stderr, truncated, shell.pid
+
+    def close_persistent_shell(self):
+        """常駐シェル停止"""
+        shell = self._persistent_shell
+        self._persistent_shell = None
+        if shell is None or shell.poll() is not None:
+            return
+
+        try:
+            os.killpg(shell.pid, signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            shell.kill()
+        shell.wait(timeout=5)
+
+    def _get_event_loop(self) -> asyncio.AbstractEventLoop:
+        """バックグラウンド実行用イベントループ取得（専用スレッドで常駐）"""
+        if self._loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="command-agent-loop", daemon=True).start()
+            self._loop = loop
+        return self._loop
+
+    async def _spawn_process(self, prepared_command: Union[str, List[str]],
+                             kwargs: Dict[str, Any]) -> asyncio.subprocess.Process:
+        """asyncioサブプロセス起動"""
+        options = {
+            'cwd': kwargs['cwd'],
+            'env': kwargs['env'],
+            'stdout': kwargs.get('stdout'),
+            'stderr': kwargs.get('stderr'),
+            # POSIXではプロセスグループごと停止できるよう新しいセッションで起動
+            'start_new_session': not self.is_windows
+        }
+        if isinstance(prepared_command, str):
+            return await asyncio.create_subprocess_shell(prepared_command, **options)
+        return await asyncio.create_subprocess_exec(*prepared_command, **options)
+
+    async def _read_stream_tail(self, stream: asyncio.StreamReader) -> Tuple[bytes, bool]:
+        """ストリームを読み切り、末尾 OUTPUT_BUFFER_LIMIT バイトのみ保持"""
+        chunks: Deque[bytes] = deque()
+        size = 0
+        truncated = False
+
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+            size += len(chunk)
+
+            # 上限超過分を先頭から破棄
+            while size > self.OUTPUT_BUFFER_LIMIT:
+                truncated = True
+                excess = size - self.OUTPUT_BUFFER_LIMIT
+                head = chunks[0]
+                if len(head) <= excess:
+                    chunks.popleft()
+                    size -= len(head)
+                else:
+                    chunks[0] = head[excess:]
+                    size -= excess
+
+        return b"".join(chunks), truncated
+
+    async def _run_streaming(self, prepared_command: Union[str, List[str]],
+                             kwargs: Dict[str, Any]) -> Tuple[int, str, str, bool, int]:
+        """出力を逐次読み込みながらコマンド実行し (exit_code, stdout, stderr, truncated, pid) を返す"""
+        process = await self._spawn_process(prepared_command, kwargs)
+        timeout = kwargs.get('timeout')
+
+        try:
+            (stdout, out_truncated), (stderr, err_truncated), exit_code = await asyncio.wait_for(
+                asyncio.gather(
+                    self._read_stream_tail(process.stdout),
+                    self._read_stream_tail(process.stderr),
+                    process.wait()
+                ),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            self._signal_process(process, force=True)
+            await process.wait()
+            raise subprocess.TimeoutExpired(prepared_command, timeout)
+        except asyncio.CancelledError:
+            self._signal_process(process, force=True)
+            raise
+
+        return (
+            exit_code,
+            stdout.decode('utf-8', errors='replace'),
+            stderr.decode('utf-8', errors='replace'),
+            out_truncated or err_truncated,
+            process.pid
+        )
+
+    async def _collect_background(self, process: asyncio.subprocess.Process):
+        """バックグラウンドプロセスの完了を待ち、結果を保存"""
+        stdout, stderr = await process.communicate()
+        self.completed_processes[process.pid] = {
+            "process_id": str(process.pid),
+            "pid": process.pid,
+            "returncode": process.returncode,
+            "is_running": False,
+            "stdout": stdout.decode('utf-8', errors='replace') if stdout else "",
+            "stderr": stderr.decode('utf-8', errors='replace') if stderr else "",
+            "exit_code": process.returncode
+        }
+        self.running_processes.pop(process.pid, None)
+
+        # check_process_status で回収されない結果が溜まり続けないよう古いものから捨てる
+        while len(self.completed_processes) > self.COMPLETED_MAXLEN:
+            self.completed_processes.pop(next(iter(self.completed_processes)), None)
+
     def execute_async(self, command: str, config: Optional[CommandConfig] = None) -> str:
-        """非同期コマンド実行（バックグラウンド）"""
+        """非同期コマンド実行（バックグラウンド）
+
+        プロセスは専用スレッドのasyncioイベントループ上で管理し、
+        完了時に結果を completed_processes へ格納する（ポーリング不要）。
+        """
 
         if config is None:
             config = self.default_config
 
         # 安全性チェック
-        is_safe, safety_msg = self.is_safe_command(command)
+        is_safe, safety_msg = self.is_safe_command(command, config)
         if not is_safe:
             return f"セキュリティエラー: {safety_msg}"
 
@@ -249,14 +591,21 @@ class CommandAgent:
             # コマンド準備
             prepared_command, kwargs = self.prepare_command(command, config)
 
-            # 非同期実行用の調整
-            kwargs.pop('timeout', None)  # 非同期ではタイムアウト削除
+            loop = self._get_event_loop()
+            process = asyncio.run_coroutine_threadsafe(
+                self._spawn_process(prepared_command, kwargs), loop
+            ).result()
 
-            process = subprocess.Popen(prepared_command, **kwargs)
+            # 完了済みジョブの Future はもう不要なので捨てる
+            for pid in [pid for pid, task in list(self._background_tasks.items()) if task.done()]:
+                self._background_tasks.pop(pid, None)
 
-            # プロセス管理に追加
-            process_id = f"{int(time.time())}_{process.pid}"
-            self.running_processes[process_id] = process
+            # プロセス管理に追加（完了待ちはイベントループ側で行う）
+            process_id = str(process.pid)
+            self.running_processes[process.pid] = process
+            self._background_tasks[process.pid] = asyncio.run_coroutine_threadsafe(
+                self._collect_background(process), loop
+            )
 
             print(f"🚀 バックグラウンド実行開始: {command}")
             print(f"   プロセスID: {process_id}")
@@ -266,66 +615,79 @@ class CommandAgent:
         except Exception as e:
             return f"非同期実行エラー: {str(e)}"
 
-    def check_process_status(self, process_id: str) -> Optional[Dict[str, Any]]:
+    @staticmethod
+    def _parse_process_id(process_id: Union[str, int]) -> Optional[int]:
+        """プロセスID（PID文字列または整数）を整数キーに変換"""
+        try:
+            return int(process_id)
+        except (TypeError, ValueError):
+            return None
+
+    def check_process_status(self, process_id: Union[str, int]) -> Optional[Dict[str, Any]]:
         """プロセス状態確認"""
 
-        if process_id not in self.running_processes:
-            return None
+        pid = self._parse_process_id(process_id)
 
-        process = self.running_processes[process_id]
+        # 完了済みの結果は一度だけ返して削除
+        if pid in self.completed_processes:
+            self._background_tasks.pop(pid, None)
+            return self.completed_processes.pop(pid)
 
-        status = {
-            "process_id": process_id,
+        if pid not in self.running_processes:
+            return None
+
+        process = self.running_processes[pid]
+        return {
+            "process_id": str(pid),
             "pid": process.pid,
             "returncode": process.returncode,
-            "is_running": process.returncode is None
+            "is_running": True
         }
 
-        # 完了している場合は出力を取得
-        if process.returncode is not None:
-            try:
-                stdout, stderr = process.communicate(timeout=1)
-                status.update({
-                    "stdout": stdout or "",
-                    "stderr": stderr or "",
-                    "exit_code": process.returncode
-                })
-
-                # 完了したプロセスは削除
-                del self.running_processes[process_id]
-
-            except subprocess.TimeoutExpired:
-                status["error"] = "出力取得タイムアウト"
+    def _signal_process(self, process: asyncio.subprocess.Process, force: bool):
+        """プロセスへ停止シグナル送信（POSIXはプロセスグループ単位）"""
+        if self.is_windows:
+            loop = self._get_event_loop()
+            loop.call_soon_threadsafe(process.kill if force else process.terminate)
+            return
 
-        return status
+        try:
+            os.killpg(process.pid, signal.SIGKILL if force else signal.SIGTERM)
+        except ProcessLookupError:
+            pass
 
-    def kill_process(self, process_id: str, force: bool = False) -> bool:
+    def kill_process(self, process_id: Union[str, int], force: bool = False) -> bool:
         """プロセス停止"""
 
-        if process_id not in self.running_processes:
+        pid = self._parse_process_id(process_id)
+        if pid not in self.running_processes:
             return False
 
-        process = self.running_processes[process_id]
+        process = self.running_processes[pid]
+        task = self._background_tasks.get(pid)
 
         try:
             if force:
-                process.kill()
+                self._signal_process(process, force=True)
                 signal_used = signal.SIGKILL if not self.is_windows else None
             else:
-                process.terminate()
+                self._signal_process(process, force=False)
                 signal_used = signal.SIGTERM if not self.is_windows else None
 
             # 停止待機
-            try:
-                process.wait(timeout=5)
-            except subprocess.TimeoutExpired:
-                if not force:
-                    # 強制終了を試行
-                    process.kill()
-                    process.wait(timeout=5)
+            if task is not None:
+                try:
+                    task.result(timeout=5)
+                except concurrent.futures.TimeoutError:
+                    if not force:
+                        # 強制終了を試行
+                        self._signal_process(process, force=True)
+                        task.result(timeout=5)
 
             # プロセス削除
-            del self.running_processes[process_id]
+            self.running_processes.pop(pid, None)
+            self.completed_processes.pop(pid, None)
+            self._background_tasks.pop(pid, None)
 
             print(f"⏹️ プロセス停止: {process_id}")
             return True
@@ -337,84 +699,84 @@ class CommandAgent:
     def analyze_command_output(self, result: CommandResult) -> Dict[str, Any]:
         """コマンド出力分析"""
 
+        if result.analysis is not None:
+            return result.analysis
+
+        # stdoutの行分割は1回だけ行い、各判定で使い回す
+        lines = result.stdout.splitlines()
+
         analysis = {
             "success": result.exit_code == 0,
             "duration_category": "fast" if result.duration < 1 else "normal" if result.duration < 10 else "slow",
             "output_size": len(result.stdout) + len(result.stderr),
             "has_errors": bool(result.stderr),
-            "line_count": len(result.stdout.splitlines()) if result.stdout else 0
+            "line_count": len(lines),
+            "truncated": result.truncated
         }
 
         # エラー分析
         if result.stderr:
+            # キーワードを1回の走査で抽出して分類
+            hits = {hit.lower() for hit in _ERROR_KEYWORD_RE.findall(result.stderr)}
             analysis["error_analysis"] = {
-                "likely_permission_error": "permission denied" in result.stderr.lower(),
-                "likely_not_found": "not found" in result.stderr.lower() or "command not found" in result.stderr.lower(),
-                "likely_network_error": any(term in result.stderr.lower() for term in ["connection", "network", "timeout", "unreachable"]),
-                "likely_syntax_error": "syntax error" in result.stderr.lower()
+                "likely_permission_error": "permission denied" in hits,
+                "likely_not_found": "not found" in hits,
+                "likely_network_error": not hits.isdisjoint(_NETWORK_ERROR_KEYWORDS),
+                "likely_syntax_error": "syntax error" in hits
             }
 
         # 成功時の出力パターン分析
         if analysis["success"] and result.stdout:
             analysis["output_analysis"] = {
                 "is_json": self._is_json_output(result.stdout),
-                "is_table": self._is_table_output(result.stdout),
-                "is_list": self._is_list_output(result.stdout),
+                "is_table": self._is_table_output(lines),
+                "is_list": self._is_list_output(lines),
                 "contains_paths": self._contains_paths(result.stdout)
             }
 
+        result.analysis = analysis
         return analysis
 
     def _is_json_output(self, output: str) -> bool:
         """JSON出力判定"""
+        # 巨大な出力や先頭/末尾がオブジェクト・配列でない出力はパースしない
+        if len(output) > self.JSON_SNIFF_LIMIT:
+            return False
+        head = output.lstrip()[:1]
+        if not head or head not in '{[' or output.rstrip()[-1:] not in '}]':
+            return False
+
         try:
-            json.loads(output.strip())
+            json.loads(output)
             return True
         except:
             return False
 
-    def _is_table_output(self, output: str) -> bool:
-        """テーブル出力判定"""
-        lines = output.strip().splitlines()
+    def _is_table_output(self, lines: List[str]) -> bool:
+        """テーブル出力判定（行分割済みの出力を受け取る）"""
         if len(lines) < 2:
             return False
 
-        # 列区切り文字の存在確認
-        separators = ['\t', '|', '  +']
-        for sep in separators:
-            if all(sep in line for line in lines[:3]):
-                return True
-        return False
+        # 列区切り文字の存在確認（先頭3行すべてに共通する区切り文字が残るか）
+        separators = _TABLE_SEPARATORS
+        for line in lines[:3]:
+            separators = [sep for sep in separators if sep in line]
+            if not separators:
+                return False
+        return True
 
-    def _is_list_output(self, output: str) -> bool:
-        """リスト出力判定"""
-        lines = output.strip().splitlines()
+    def _is_list_output(self, lines: List[str]) -> bool:
+        """リスト出力判定（行分割済みの出力を受け取る）"""
         if len(lines) < 2:
             return False
 
-        # リストマーカーの確認
-        list_markers = ['-', '*', '+', '•']
-        for marker in list_markers:
-            if sum(1 for line in lines if line.strip().startswith(marker)) > len(lines) / 2:
-                return True
-        return False
+        # リストマーカーの確認（1パスで全マーカーを判定）
+        hits = sum(1 for line in lines if line.lstrip().startswith(_LIST_MARKERS))
+        return hits > len(lines) / 2
 
     def _contains_paths(self, output: str) -> bool:
         """パス含有判定"""
-        import re
-
-        # Windows/Unixパスパターン
-        path_patterns = [
-            r'[a-zA-Z]:\\[\w\\.-]+',  # Windows絶対パス
-            r'/[\w/.-]+',              # Unix絶対パス
-            r'\.[\w/.-]+',             # 相対パス
-            r'~[\w/.-]*'               # ホームパス
-        ]
-
-        for pattern in path_patterns:
-            if re.search(pattern, output):
-                return True
-        return False
+        return _PATH_RE.search(output) is not None
 
     def suggest_command_improvements(self, result: CommandResult) -> List[str]:
         """コマンド改善提案"""
@@ -450,36 +812,77 @@ class CommandAgent:
             # 分析結果
             analysis = self.analyze_command_output(result)
 
-            # 履歴マネージャーに記録
-            self.history_manager.log_command_execution(
-                command=result.command,
-                exit_code=result.exit_code,
-                duration=result.duration,
-                output_size=analysis["output_size"],
-                success=analysis["success"],
-                error_message=result.stderr if result.stderr else None
-            )
+            # バッファに積み、DB書き込みはログスレッドでまとめて行う
+            self._log_buffer.append({
+                "command_line": result.command,
+                "exit_code": result.exit_code,
+                "stderr_text": result.stderr,
+                "execution_time_ms": int(result.duration * 1000),
+                "context_info": {
+                    "output_size": analysis["output_size"],
+                    "success": analysis["success"]
+                },
+                "timestamp": datetime.fromtimestamp(result.timestamp).isoformat()
+            })
+            self._start_log_worker()
+            if len(self._log_buffer) >= self.LOG_BATCH_SIZE:
+                self._log_event.set()
+
+        except Exception as e:
+            print(f"コマンドログ記録エラー: {e}")
+
+    def _start_log_worker(self):
+        """ログ書き込みスレッドが動いていなければ起動"""
+        with self._log_lock:
+            if self._log_thread is None:
+                self._log_thread = threading.Thread(
+                    target=self._log_worker, name="command-agent-log", daemon=True)
+                self._log_thread.start()
 
+    def _log_worker(self):
+        """ログ書き込みスレッド（件数または時間間隔でフラッシュし、バッファが空なら終了）"""
+        while True:
+            self._log_event.wait(self.LOG_FLUSH_INTERVAL)
+            self._log_event.clear()
+            self.flush_logs()
+            with self._log_lock:
+                if not self._log_buffer:
+                    self._log_thread = None
+                    return
+
+    def flush_logs(self):
+        """バッファ済みのコマンドログをDBへ一括書き込み"""
+        batch = []
+        while self._log_buffer:
+            batch.append(self._log_buffer.popleft())
+        if not batch:
+            return
+
+        try:
+            self.history_manager.log_command_executions(batch)
         except Exception as e:
             print(f"コマンドログ記録エラー: {e}")
 
     def get_command_history(self, limit: int = 10) -> List[Dict[str, Any]]:
         """コマンド履歴取得"""
 
-        recent_history = self.command_history[-limit:] if limit > 0 else self.command_history
+        # 末尾から必要件数だけ辿り、最後に古い順へ並べ直す（スライスのコピーを作らない）
+        recent_history = islice(reversed(self.command_history), limit) if limit > 0 else reversed(self.command_history)
 
-        return [
+        history = [
             {
                 "command": cmd.command,
                 "exit_code": cmd.exit_code,
                 "duration": cmd.duration,
                 "timestamp": cmd.timestamp,
                 "success": cmd.exit_code == 0,
-                "has_output": bool(cmd.stdout),
-                "has_errors": bool(cmd.stderr)
+                "has_output": cmd.has_output,
+                "has_errors": cmd.has_errors
             }
             for cmd in recent_history
         ]
+        history.reverse()
+        return history
 
     def interactive_mode(self):
         """対話モード"""
@@ -491,46 +894,24 @@ class CommandAgent:
         while True:
             try:
                 command = input("\n> ").strip()
+                command_lower = command.lower()
 
-                if command.lower() in ['exit', 'quit', 'q']:
+                if command_lower in self.EXIT_COMMANDS:
                     break
 
-                elif command.lower() == 'help':
-                    self._show_help()
+                # 組み込みコマンド（完全一致 → プレフィックス）
+                handler = self._commands.get(command_lower)
+                if handler:
+                    handler()
                     continue
 
-                elif command.lower() == 'history':
-                    history = self.get_command_history()
-                    for i, cmd in enumerate(history, 1):
-                        status = "✅" if cmd["success"] else "❌"
-                        print(f"{i:2d}. {status} {cmd['command'][:50]}...")
-                    continue
-
-                elif command.lower() == 'status':
-                    if self.running_processes:
-                        print("実行中プロセス:")
-                        for pid, process in self.running_processes.items():
-                            status = "実行中" if process.returncode is None else f"終了({process.returncode})"
-                            print(f"  {pid}: {status}")
-                    else:
-                        print("実行中プロセスなし")
-                    continue
-
-                elif command.startswith('kill '):
-                    process_id = command[5:].strip()
-                    if self.kill_process(process_id):
-                        print(f"✅ プロセス停止: {process_id}")
-                    else:
-                        print(f"❌ プロセス停止失敗: {process_id}")
-                    continue
-
-                elif command.startswith('async '):
-                    async_command = command[6:].strip()
-                    process_id = self.execute_async(async_command)
-                    if not process_id.startswith("セキュリティエラー"):
-                        print(f"🚀 バックグラウンド実行: {process_id}")
-                    else:
-                        print(f"❌ {process_id}")
+                prefix_handler = next(
+                    ((prefix, handler) for prefix, handler in self._prefix_commands if command.startswith(prefix)),
+                    None
+                )
+                if prefix_handler:
+                    prefix, handler = prefix_handler
+                    handler(command[len(prefix):].strip())
                     continue
 
                 if not command:
@@ -552,9 +933,7 @@ class CommandAgent:
                 # 改善提案
                 suggestions = self.suggest_command_improvements(result)
                 if suggestions:
-                    print("\n💡 改善提案:")
-                    for suggestion in suggestions:
-                        print(f"   • {suggestion}")
+                    print("\n💡 改善提案:\n" + "\n".join(f"   • {suggestion}" for suggestion in suggestions))
 
             except KeyboardInterrupt:
                 print("\n\n中断されました")
@@ -562,6 +941,41 @@ class CommandAgent:
             except Exception as e:
                 print(f"エラー: {e}")
 
+    def _show_history(self):
+        """コマンド履歴表示（対話モード）"""
+        history = self.get_command_history()
+        if history:
+            print("\n".join(
+                f"{i:2d}. {'✅' if cmd['success'] else '❌'} {cmd['command'][:50]}..."
+                for i, cmd in enumerate(history, 1)
+            ))
+
+    def _show_status(self):
+        """実行中プロセス表示（対話モード）"""
+        if self.running_processes:
+            print("実行中プロセス:\n" + "\n".join(
+                f"  {pid}: {'実行中' if process.returncode is None else f'終了({process.returncode})'}"
+                # イベントループ側のスレッドが完了時に削除するのでコピーを走査
+                for pid, process in list(self.running_processes.items())
+            ))
+        else:
+            print("実行中プロセスなし")
+
+    def _handle_kill(self, process_id: str):
+        """kill <pid>（対話モード）"""
+        if self.kill_process(process_id):
+            print(f"✅ プロセス停止: {process_id}")
+        else:
+            print(f"❌ プロセス停止失敗: {process_id}")
+
+    def _handle_async(self, async_command: str):
+        """async <command>（対話モード）"""
+        process_id = self.execute_async(async_command)
+        if not process_id.startswith("セキュリティエラー"):
+            print(f"🚀 バックグラウンド実行: {process_id}")
+        else:
+            print(f"❌ {process_id}")
+
     def _show_help(self):
         """ヘルプ表示"""
         help_text = """
@@ -584,7 +998,7 @@ class CommandAgent:
   > git status
   > async python long_running_script.py
   > ps aux
-  > kill process_123
+  > kill 12345
         """
         print(help_text)
 
@@ -601,6 +1015,7 @@ def main():
     parser.add_argument("--unsafe", action="store_true", help="セーフモード無効化")
     parser.add_argument("--history", action="store_true", help="履歴表示")
     parser.add_argument("--cwd", help="作業ディレクトリ")
+    parser.add_argument("--persistent-shell", action="store_true", help="常駐シェルでコマンドを実行（POSIXのみ）")
 
     args = parser.parse_args()
 
@@ -615,14 +1030,16 @@ def main():
     agent.default_config.timeout = args.timeout
     if args.cwd:
         agent.default_config.working_dir = args.cwd
+    agent.default_config.persistent_shell = args.persistent_shell
 
     if args.history:
         history = agent.get_command_history(20)
         print("📊 コマンド履歴:")
-        for i, cmd in enumerate(history, 1):
-            status = "✅" if cmd["success"] else "❌"
-            duration = f"{cmd['duration']:.2f}s"
-            print(f"{i:2d}. {status} [{duration}] {cmd['command']}")
+        if history:
+            print("\n".join(
+                f"{i:2d}. {'✅' if cmd['success'] else '❌'} [{cmd['duration']:.2f}s] {cmd['command']}"
+                for i, cmd in enumerate(history, 1)
+            ))
 
     elif args.interactive:
         agent.interactive_mode()
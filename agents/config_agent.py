@@ -6,22 +6,170 @@ YAML設定の生成、管理、LLM設定の動的更新
 """
 
 import os
+import re
 import sys
+import math
+import hashlib
 import yaml
+import concurrent.futures
+from operator import attrgetter
 import json
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Union
+from typing import Dict, List, Optional, Any, Union, Tuple
 from dataclasses import dataclass, asdict
 
+# libyaml (C拡張) があれば使用し、無ければ純Python実装にフォールバック
+try:
+    from yaml import CSafeLoader as _YamlLoader, CSafeDumper as _YamlDumper
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader, SafeDumper as _YamlDumper
+
 # プロジェクトパスを追加
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from services.llm.llm_common import load_config, load_prompt_templates
+from services.llm.llm_common import load_config, load_prompt_templates, print_json
 from services.db.llm_history_manager import LLMHistoryManager
 
+# プロバイダー検出・状態表示で参照する環境変数
+_LLM_ENV_KEYS = (
+    "GEMINI_API_KEY", "GEMINI_MODEL",
+    "HF_TOKEN", "HUGGINGFACEHUB_API_TOKEN", "HF_MODEL", "HF_API_URL",
+    "OLLAMA_HOST", "OLLAMA_MODEL"
+)
+
+# ソートキー
+_BY_PRIORITY = attrgetter("priority")
+
+# プロバイダー疎通確認用の共有スレッドプール
+_PROBE_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix="llm-probe")
+_PROBE_TIMEOUT = 5
+
+
+def _probe_ollama(ollama_host: str) -> bool:
+    """Ollama の /api/tags に接続できるか確認"""
+    import requests
+    response = requests.get(f"{ollama_host}/api/tags", timeout=_PROBE_TIMEOUT)
+    return response.status_code == 200
+
+
+# YAMLパース結果キャッシュ: path -> (st_mtime_ns, st_size, parsed)
+_yaml_cache: Dict[str, Tuple[int, int, Any]] = {}
+_yaml_cache_stats = {"hits": 0, "misses": 0}
+
+
+def _load_yaml_cached(config_path: Path) -> Any:
+    """mtime+サイズが変わっていなければパース済みの結果を再利用してYAMLを読み込む
+
+    ファイルが存在しない場合は FileNotFoundError。戻り値はキャッシュと共有のオブジェクトなので、
+    変更する呼び出し側は自分でコピーしてから書き換えること。
+    """
+    st = config_path.stat()
+    key = str(config_path)
+    cached = _yaml_cache.get(key)
+
+    if cached is not None and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        _yaml_cache_stats["hits"] += 1
+        data = cached[2]
+    else:
+        _yaml_cache_stats["misses"] += 1
+        with open(config_path, 'r', encoding='utf-8') as f:
+            data = yaml.load(f, Loader=_YamlLoader)
+        _yaml_cache[key] = (st.st_mtime_ns, st.st_size, data)
+
+    return data
+
+
+# 引用符なしで出力しても型が変わらない文字列
+_PLAIN_SCALAR_RE = re.compile(r'[A-Za-z_/][\w./@+\-]*(?::[\w./@+\-]+)*\Z')
+_YAML_RESERVED_WORDS = frozenset({"true", "false", "yes", "no", "on", "off", "y", "n", "null"})
+# JSON文字列ではエスケープされないが、YAMLでは使えない（または改行扱いになる）文字
+_YAML_UNSAFE_CHAR_RE = re.compile('[\x7f-\x9f\u2028\u2029\ud800-\udfff\ufffe\uffff]')
+
+
+def _emit_scalar(value: Any) -> Optional[str]:
+    """スカラー値をYAML表現に変換（未対応の型は None）"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return None
+        # "1e-05" のように小数点を含まない表記はYAML 1.1では文字列になるので "1.0e-05" にする
+        text = repr(value)
+        return text if '.' in text else text.replace('e', '.0e')
+    if isinstance(value, str):
+        if _PLAIN_SCALAR_RE.match(value) and value.lower() not in _YAML_RESERVED_WORDS:
+            return value
+        # JSON文字列はYAMLのダブルクォート文字列としても有効（YAMLで使えない文字だけ追加でエスケープ）
+        return _YAML_UNSAFE_CHAR_RE.sub(
+            lambda m: f"\\u{ord(m.group()):04x}", json.dumps(value, ensure_ascii=False)
+        )
+    return None
+
+
+def _emit_block(data: Dict[str, Any], indent: str, out: List[str]) -> bool:
+    """辞書をブロック形式で out に追記（未対応の値があれば False）"""
+    for key, value in data.items():
+        key_text = _emit_scalar(key) if isinstance(key, str) else None
+        if key_text is None:
+            return False
+
+        if isinstance(value, dict):
+            if not value:
+                out.append(f"{indent}{key_text}: {{}}\n")
+                continue
+            out.append(f"{indent}{key_text}:\n")
+            if not _emit_block(value, indent + "  ", out):
+                return False
+        elif isinstance(value, list):
+            if not value:
+                out.append(f"{indent}{key_text}: []\n")
+                continue
+            out.append(f"{indent}{key_text}:\n")
+            for item in value:
+                item_text = _emit_scalar(item)
+                if item_text is None:
+                    return False
+                out.append(f"{indent}- {item_text}\n")
+        else:
+            value_text = _emit_scalar(value)
+            if value_text is None:
+                return False
+            out.append(f"{indent}{key_text}: {value_text}\n")
+    return True
+
+
+def _emit_llm_config_fast(config: Dict[str, Any]) -> Optional[str]:
+    """generate_llm_config 形式の設定を汎用ダンパーを通さずにYAML化
+
+    想定外の構造・値を含む場合は None（呼び出し側で汎用ダンパーにフォールバック）。
+    """
+    if set(config) != {"llm"} or not isinstance(config["llm"], dict):
+        return None
+    out: List[str] = []
+    return "".join(out) if _emit_block(config, "", out) else None
+
+
+def _emit_agent_config_fast(config: Dict[str, Any]) -> Optional[str]:
+    """generate_agent_config 形式の設定を汎用ダンパーを通さずにYAML化"""
+    if set(config) != {"agents", "global_settings"}:
+        return None
+    out: List[str] = []
+    return "".join(out) if _emit_block(config, "", out) else None
+
+
+# 専用エミッタを持つ設定
+_FAST_EMITTERS = {
+    "llm": _emit_llm_config_fast,
+    "agent": _emit_agent_config_fast,
+}
+
 
-@dataclass
+@dataclass(slots=True)
 class LLMProviderConfig:
     """LLMプロバイダー設定"""
     name: str
@@ -35,7 +183,7 @@ class LLMProviderConfig:
     priority: int = 1
 
 
-@dataclass
+@dataclass(slots=True)
 class AgentConfig:
     """エージェント設定"""
     name: str
@@ -62,35 +210,72 @@ class ConfigAgent:
             "prompts": self.config_dir / "prompt_templates.yaml"
         }
 
+        # generate_llm_config のソート結果: ((name, priority), ...) -> 並び順のインデックス
+        self._sorted_providers: Optional[Tuple[Tuple[Tuple[str, int], ...], List[int]]] = None
+
+        # 最後に書き込んだ（または読み取った）内容: config_name -> (sha256, st_mtime_ns, st_size)
+        self._config_hashes: Dict[str, Tuple[str, int, int]] = {}
+
+        # LLM関連環境変数のスナップショット（load_all_configs でリセット）
+        self._llm_env: Optional[Dict[str, str]] = None
+
         # 現在の設定をロード
         self.current_config = self.load_all_configs()
 
     def load_all_configs(self) -> Dict[str, Any]:
-        """全設定ファイルを読み込み"""
+        """全設定ファイルを読み込み（各設定はパースキャッシュと共有のため読み取り専用として扱う）"""
         configs = {}
+        self._llm_env = None
 
         for config_name, config_path in self.config_files.items():
             try:
-                if config_path.exists():
-                    with open(config_path, 'r', encoding='utf-8') as f:
-                        configs[config_name] = yaml.safe_load(f) or {}
-                else:
-                    configs[config_name] = {}
+                configs[config_name] = _load_yaml_cached(config_path) or {}
+            except FileNotFoundError:
+                configs[config_name] = {}
             except Exception as e:
                 print(f"設定読み込みエラー ({config_name}): {e}")
                 configs[config_name] = {}
 
         return configs
 
+    def _stored_config_hash(self, config_name: str, config_path: Path) -> Optional[str]:
+        """ディスク上の設定ファイル内容のハッシュ（外部で変更されていれば読み直す）"""
+        try:
+            st = config_path.stat()
+        except FileNotFoundError:
+            return None
+
+        recorded = self._config_hashes.get(config_name)
+        if recorded is not None and recorded[1:] == (st.st_mtime_ns, st.st_size):
+            return recorded[0]
+
+        # 初回または外部変更時はファイル内容からシード
+        digest = hashlib.sha256(config_path.read_bytes()).hexdigest()
+        self._config_hashes[config_name] = (digest, st.st_mtime_ns, st.st_size)
+        return digest
+
     def save_config(self, config_name: str, config_data: Dict[str, Any]) -> bool:
-        """設定ファイルを保存"""
+        """設定ファイルを保存（内容がディスク上と同一なら書き込まない）"""
         try:
             config_path = self.config_files[config_name]
             config_path.parent.mkdir(parents=True, exist_ok=True)
 
-            with open(config_path, 'w', encoding='utf-8') as f:
-                yaml.dump(config_data, f, default_flow_style=False,
-                         allow_unicode=True, sort_keys=False)
+            emitter = _FAST_EMITTERS.get(config_name)
+            text = emitter(config_data) if emitter else None
+            if text is None:
+                text = yaml.dump(config_data, Dumper=_YamlDumper, default_flow_style=False,
+                                 allow_unicode=True, sort_keys=False)
+
+            digest = hashlib.sha256(text.encode('utf-8')).hexdigest()
+            if digest != self._stored_config_hash(config_name, config_path):
+                with open(config_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+
+                st = config_path.stat()
+                self._config_hashes[config_name] = (digest, st.st_mtime_ns, st.st_size)
+
+                # 書き込んだファイルのパースキャッシュを破棄
+                _yaml_cache.pop(str(config_path), None)
 
             # 現在の設定を更新
             self.current_config[config_name] = config_data
@@ -145,7 +330,7 @@ class ConfigAgent:
         }
 
         # プロバイダー設定を追加
-        for provider in sorted(provider_configs, key=lambda x: x.priority):
+        for provider in self._sort_by_priority(provider_configs):
             config["llm"]["providers"][provider.name] = {
                 "enabled": provider.enabled,
                 "api_url": provider.api_url,
@@ -164,6 +349,15 @@ class ConfigAgent:
 
         return config
 
+    def _sort_by_priority(self, provider_configs: List[LLMProviderConfig]) -> List[LLMProviderConfig]:
+        """priority順に並べる（同じ name/priority の並びなら前回の順序を再利用）"""
+        key = tuple((p.name, p.priority) for p in provider_configs)
+        if self._sorted_providers is None or self._sorted_providers[0] != key:
+            priorities = list(map(_BY_PRIORITY, provider_configs))
+            order = sorted(range(len(priorities)), key=priorities.__getitem__)
+            self._sorted_providers = (key, order)
+        return [provider_configs[i] for i in self._sorted_providers[1]]
+
     def generate_agent_config(self, agent_configs: List[AgentConfig] = None) -> Dict[str, Any]:
         """エージェント設定を生成"""
 
@@ -201,22 +395,34 @@ class ConfigAgent:
 
         return config
 
+    def _get_llm_env(self) -> Dict[str, str]:
+        """LLM関連の環境変数スナップショットを取得（設定再読み込みまで再利用）"""
+        if self._llm_env is None:
+            environ = os.environ
+            self._llm_env = {key: environ[key] for key in _LLM_ENV_KEYS if key in environ}
+        return self._llm_env
+
     def auto_detect_llm_providers(self) -> List[LLMProviderConfig]:
         """環境からLLMプロバイダーを自動検出"""
         detected_providers = []
+        env = self._get_llm_env()
+
+        # ネットワーク疎通確認は先に投げておき、環境変数による検出と並行させる
+        ollama_host = env.get("OLLAMA_HOST", "http://localhost:11434")
+        ollama_probe = _PROBE_EXECUTOR.submit(_probe_ollama, ollama_host)
 
         # Gemini検出
-        if os.getenv("GEMINI_API_KEY"):
+        if env.get("GEMINI_API_KEY"):
             detected_providers.append(LLMProviderConfig(
                 name="gemini",
                 api_url="https://generativelanguage.googleapis.com/v1beta",
-                model=os.getenv("GEMINI_MODEL", "gemini-2.0-flash-exp"),
+                model=env.get("GEMINI_MODEL", "gemini-2.0-flash-exp"),
                 priority=1
             ))
 
         # HuggingFace検出
-        if os.getenv("HF_TOKEN") or os.getenv("HUGGINGFACEHUB_API_TOKEN"):
-            model = os.getenv("HF_MODEL", "meta-llama/Llama-3.2-3B-Instruct")
+        if env.get("HF_TOKEN") or env.get("HUGGINGFACEHUB_API_TOKEN"):
+            model = env.get("HF_MODEL", "meta-llama/Llama-3.2-3B-Instruct")
             if ":" in model:  # groq形式の場合
                 model_parts = model.split(":")
                 if len(model_parts) >= 2:
@@ -224,30 +430,28 @@ class ConfigAgent:
 
             detected_providers.append(LLMProviderConfig(
                 name="huggingface",
-                api_url=os.getenv("HF_API_URL", "https://api-inference.huggingface.co/v1"),
+                api_url=env.get("HF_API_URL", "https://api-inference.huggingface.co/v1"),
                 model=model,
                 priority=2
             ))
 
         # Ollama検出
-        ollama_host = os.getenv("OLLAMA_HOST", "http://localhost:11434")
         try:
-            import requests
-            response = requests.get(f"{ollama_host}/api/tags", timeout=5)
-            if response.status_code == 200:
+            if ollama_probe.result(timeout=_PROBE_TIMEOUT):
                 detected_providers.append(LLMProviderConfig(
                     name="ollama",
                     api_url=ollama_host,
-                    model=os.getenv("OLLAMA_MODEL", "qwen2.5:1.5b-instruct"),
+                    model=env.get("OLLAMA_MODEL", "qwen2.5:1.5b-instruct"),
                     priority=3
                 ))
         except:
+            ollama_probe.cancel()
             # Ollamaが利用できない場合もデフォルト設定は作成
             detected_providers.append(LLMProviderConfig(
                 name="ollama",
                 enabled=False,
                 api_url=ollama_host,
-                model=os.getenv("OLLAMA_MODEL", "qwen2.5:1.5b-instruct"),
+                model=env.get("OLLAMA_MODEL", "qwen2.5:1.5b-instruct"),
                 priority=3
             ))
 
@@ -256,58 +460,40 @@ class ConfigAgent:
     def update_from_history(self) -> Dict[str, Any]:
         """履歴データから設定を最適化"""
 
-        # プロバイダー統計を取得
-        stats = self.history_manager.get_provider_stats(7)  # 過去7日
+        # プロバイダー別スコア（過去7日、DB側で集計・スコア降順に整列済み）
+        scores = self.history_manager.get_provider_scores(7)
 
         optimization_suggestions = {
             "provider_performance": [],
             "recommended_priority": [],
             "configuration_updates": {}
         }
+        configuration_updates = optimization_suggestions["configuration_updates"]
 
-        for stat in stats:
-            provider_name = stat['provider']
-            total_requests = stat['total_requests']
-            success_rate = stat['successful_requests'] / total_requests if total_requests > 0 else 0
-            avg_response_time = stat['avg_response_time'] or 0
-
-            # パフォーマンス評価
-            performance_score = success_rate * 0.7 + (1.0 / (1.0 + avg_response_time / 1000)) * 0.3
+        for row in scores:
+            provider_name = row["provider"]
+            avg_response_time = row["avg_response_time"]
 
             optimization_suggestions["provider_performance"].append({
                 "provider": provider_name,
-                "success_rate": success_rate,
+                "success_rate": row["success_rate"],
                 "avg_response_time_ms": avg_response_time,
-                "performance_score": performance_score,
-                "total_requests": total_requests
+                "performance_score": row["performance_score"],
+                "total_requests": row["total_requests"]
             })
 
-        # 推奨優先順位
-        sorted_providers = sorted(
-            optimization_suggestions["provider_performance"],
-            key=lambda x: x["performance_score"],
-            reverse=True
-        )
-
-        optimization_suggestions["recommended_priority"] = [
-            p["provider"] for p in sorted_providers if p["total_requests"] > 0
-        ]
-
-        # 設定更新提案
-        for provider_perf in sorted_providers:
-            provider_name = provider_perf["provider"]
+            # 推奨優先順位
+            optimization_suggestions["recommended_priority"].append(provider_name)
 
             # タイムアウト調整提案
-            if provider_perf["avg_response_time"] > 5000:  # 5秒以上
-                optimization_suggestions["configuration_updates"][provider_name] = {
-                    "timeout": min(60, provider_perf["avg_response_time"] / 1000 + 10)
+            if avg_response_time > 5000:  # 5秒以上
+                configuration_updates[provider_name] = {
+                    "timeout": min(60, avg_response_time / 1000 + 10)
                 }
 
             # 無効化提案
-            if provider_perf["success_rate"] < 0.1 and provider_perf["total_requests"] > 10:
-                if provider_name not in optimization_suggestions["configuration_updates"]:
-                    optimization_suggestions["configuration_updates"][provider_name] = {}
-                optimization_suggestions["configuration_updates"][provider_name]["enabled"] = False
+            if row["success_rate"] < 0.1 and row["total_requests"] > 10:
+                configuration_updates.setdefault(provider_name, {})["enabled"] = False
 
         return optimization_suggestions
 
@@ -316,6 +502,7 @@ class ConfigAgent:
         try:
             # LLMプロバイダー自動検出
             detected_providers = self.auto_detect_llm_providers()
+            by_name = {p.name: p for p in detected_providers}
 
             # 履歴ベースの最適化
             optimization = self.update_from_history()
@@ -323,13 +510,13 @@ class ConfigAgent:
             # 最適化を適用
             if optimization["recommended_priority"]:
                 for i, provider_name in enumerate(optimization["recommended_priority"]):
-                    provider = next((p for p in detected_providers if p.name == provider_name), None)
+                    provider = by_name.get(provider_name)
                     if provider:
                         provider.priority = i + 1
 
             # 設定更新を適用
             for provider_name, updates in optimization["configuration_updates"].items():
-                provider = next((p for p in detected_providers if p.name == provider_name), None)
+                provider = by_name.get(provider_name)
                 if provider:
                     for key, value in updates.items():
                         setattr(provider, key, value)
@@ -342,15 +529,21 @@ class ConfigAgent:
             agent_config = self.generate_agent_config()
             self.save_config("agent", agent_config)
 
-            # メイン設定更新
-            main_config = self.current_config.get("main", {})
+            # メイン設定更新（構造的なキーが変わった時だけYAMLを書き直す）
+            # current_config の中身はパースキャッシュと共有なのでコピーしてから変更する
+            current_main = self.current_config.get("main", {})
+            main_config = dict(current_main)
             main_config.update({
                 "project_name": "NeuroHub",
                 "version": "1.0.0",
-                "auto_generated": True,
-                "last_updated": str(Path(__file__).stat().st_mtime)
+                "auto_generated": True
             })
-            self.save_config("main", main_config)
+            main_config.pop("last_updated", None)
+            if main_config != current_main:
+                self.save_config("main", main_config)
+
+            # 更新時刻はYAMLではなくサイドカーファイルに記録
+            self.last_updated_path.write_text(f"{Path(__file__).stat().st_mtime_ns}\n")
 
             print("✅ 設定ファイル生成完了")
             print(f"   LLM設定: {self.config_files['llm']}")
@@ -366,16 +559,37 @@ class ConfigAgent:
             print(f"❌ 設定生成エラー: {e}")
             return False
 
+    @property
+    def last_updated_path(self) -> Path:
+        """最終更新時刻のサイドカーファイル"""
+        return self.config_dir / ".last_updated"
+
+    def get_last_updated(self) -> Optional[int]:
+        """最終更新時刻（ns）を取得。サイドカーが無ければ旧形式の main 設定を参照"""
+        try:
+            return int(self.last_updated_path.read_text().strip())
+        except (OSError, ValueError):
+            pass
+
+        legacy = self.current_config.get("main", {}).get("last_updated")
+        try:
+            return int(float(legacy) * 1_000_000_000) if legacy is not None else None
+        except (TypeError, ValueError):
+            return None
+
     def get_config_status(self) -> Dict[str, Any]:
         """設定状態を取得"""
+        env = self._get_llm_env()
         status = {
             "config_files": {},
             "current_config": self.current_config,
             "environment_vars": {
-                "GEMINI_API_KEY": bool(os.getenv("GEMINI_API_KEY")),
-                "HF_TOKEN": bool(os.getenv("HF_TOKEN")),
-                "OLLAMA_HOST": os.getenv("OLLAMA_HOST", "default")
-            }
+                "GEMINI_API_KEY": bool(env.get("GEMINI_API_KEY")),
+                "HF_TOKEN": bool(env.get("HF_TOKEN")),
+                "OLLAMA_HOST": env.get("OLLAMA_HOST", "default")
+            },
+            "yaml_cache": dict(_yaml_cache_stats),
+            "last_updated": self.get_last_updated()
         }
 
         for config_name, config_path in self.config_files.items():
@@ -404,12 +618,12 @@ def main():
 
     if args.status:
         status = agent.get_config_status()
-        print(json.dumps(status, ensure_ascii=False, indent=2))
+        print_json(status)
 
     elif args.optimize:
         optimization = agent.update_from_history()
         print("📊 履歴ベース最適化結果:")
-        print(json.dumps(optimization, ensure_ascii=False, indent=2))
+        print_json(optimization)
 
     elif args.generate:
         if args.config:
@@ -6,12 +6,17 @@ tools/git_commit_aiのPython版
 """
 
 import os
+import re
 import sys
-import json
+import time
+import hashlib
 import subprocess
+import concurrent.futures
 import tempfile
+import threading
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from dataclasses import dataclass
 
 # プロジェクトパスを追加
@@ -23,15 +28,14 @@ from services.llm.llm_common import (
     load_config,
     get_prompt_template,
     get_system_message,
-    auto_log_llm_request
+    auto_log_llm_request,
+    count_diff_lines,
+    print_json
 )
-from services.llm.provider_gemini import GeminiConfig
-from services.llm.provider_huggingface import HuggingFaceConfig
-from services.llm.provider_ollama import OllamaConfig
 from services.db.llm_history_manager import LLMHistoryManager
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GitStatus:
     """Git状態情報"""
     staged: List[str]
@@ -41,101 +45,389 @@ class GitStatus:
     total_files: int
 
 
+@dataclass
+class FileDiff:
+    """ファイル単位の差分"""
+    path: str
+    diff: str
+    added_lines: int
+    removed_lines: int
+
+
+# パッチ出力をファイル単位に分割する位置（各ファイルの "diff --git" ヘッダ行頭。
+# 競合中のファイルは "* Unmerged path" 行だけが出力される）
+_DIFF_HEADER_RE = re.compile(r'^(?=diff --git |\* Unmerged path )', re.MULTILINE)
+
+
+# LLMプロバイダー並列呼び出し用の共有スレッドプール
+_LLM_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=3, thread_name_prefix="git-agent-llm")
+
+
+# これを超える長さ（文字数）の差分は "Large diff" 見出し + 先頭20行に要約してLLMへ送る
+_DIFF_SUMMARY_THRESHOLD = 2000
+_DIFF_SUMMARY_LINES = 20
+
+
+# 生成済みコミットメッセージの有効期間（日）
+_COMMIT_CACHE_TTL_DAYS = 7
+
+
+def _is_valid_commit_message(message: str) -> bool:
+    """生成メッセージのフォーマット検証"""
+    return message.startswith(':') and len(message) <= 120
+
+
+# get_git_status のスナップショットを再利用する最大秒数
+# （ワークツリーのみの変更は .git/index に現れないため時間でも上限を設ける）
+_STATUS_CACHE_TTL = 2.0
+
+
+class _GitWorker:
+    """常駐させた `git cat-file --batch` プロセスでオブジェクト内容を取得する"""
+
+    def __init__(self, cwd: Path):
+        self.cwd = cwd
+        self._process: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _ensure_process(self) -> subprocess.Popen:
+        if self._process is None or self._process.poll() is not None:
+            self._process = subprocess.Popen(
+                ["git", "cat-file", "--batch"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=self.cwd
+            )
+        return self._process
+
+    def read_object(self, ref: str, max_size: Optional[int] = None) -> Optional[bytes]:
+        """オブジェクトの内容を返す（存在しない場合は None）
+
+        ref はオブジェクトIDのほか ":0:<path>" / "HEAD:<path>" なども指定できる。
+        max_size を超えるオブジェクトは内容を読み捨てて None を返す。
+        """
+        with self._lock:
+            process = self._ensure_process()
+            process.stdin.write(ref.encode('utf-8') + b'\n')
+            process.stdin.flush()
+
+            # ヘッダ: "<oid> <type> <size>"、見つからない場合は "<ref> missing" など
+            header = process.stdout.readline().rstrip(b'\n').rsplit(b' ', 2)
+            if len(header) != 3 or not header[2].isdigit():
+                return None
+            size = int(header[2])
+            if max_size is not None and size > max_size:
+                # 次の要求とずれないよう、内容と末尾の改行をパイプから読み捨てる
+                remaining = size + 1
+                while remaining:
+                    remaining -= len(process.stdout.read(min(remaining, 1 << 20)))
+                return None
+            content = process.stdout.read(size)
+            process.stdout.read(1)  # 末尾の改行
+            return content
+
+    def close(self):
+        """常駐プロセスを終了"""
+        with self._lock:
+            if self._process is not None:
+                if self._process.poll() is None:
+                    self._process.stdin.close()
+                    self._process.wait()
+                self._process = None
+
+
 class GitAgent:
     """Git操作を支援するPythonエージェント"""
 
     def __init__(self, config_path: str = None):
         self.project_root = project_root
         self.config = load_config()
-        self.history_manager = LLMHistoryManager()
 
         # 環境設定読み込み
         load_env_from_config()
 
-        # LLMエージェント初期化
+        # 履歴DB・LLMエージェント・プロバイダー・セッションは初回利用時に初期化
+        # （--status など LLM を使わない経路では生成しない）
+
+        # 常駐 git cat-file プロセス（初回利用時に起動）
+        self._git_worker = _GitWorker(self.project_root)
+
+        # get_git_status のスナップショット: (index の mtime_ns, size, 取得時刻, GitStatus)
+        self._status_cache: Optional[Tuple[int, int, float, GitStatus]] = None
+
+    @cached_property
+    def history_manager(self) -> LLMHistoryManager:
+        """履歴マネージャー（初回アクセス時にDBを開く）"""
+        return LLMHistoryManager()
+
+    @cached_property
+    def llm_agent(self):
+        """LLMエージェント（初回アクセス時に生成）"""
         from agents.llm_agent import LLMAgent
-        self.llm_agent = LLMAgent()
+        return LLMAgent()
+
+    @cached_property
+    def providers(self) -> Dict[str, Any]:
+        """LLMプロバイダー（初回アクセス時にインポート・生成）"""
+        from services.llm.provider_gemini import GeminiConfig
+        from services.llm.provider_huggingface import HuggingFaceConfig
+        from services.llm.provider_ollama import OllamaConfig
 
-        # LLMプロバイダー初期化
-        self.providers = {
+        return {
             'gemini': GeminiConfig(),
             'huggingface': HuggingFaceConfig(),
             'ollama': OllamaConfig()
         }
 
-        # セッション開始
-        self.session_id = self.history_manager.start_session("git_agent")
+    @cached_property
+    def session_id(self) -> str:
+        """セッションID（初回アクセス時にセッション開始）"""
+        return self.history_manager.start_session("git_agent")
+
+    def _run_git(self, args: List[str]) -> subprocess.CompletedProcess:
+        """gitをシェルを介さずに実行
+
+        GIT_OPTIONAL_LOCKS=0 で、status 等が index 更新のために取るロックを省き、
+        並行して動く git プロセスとの競合を避ける。
+        """
+        return subprocess.run(
+            ["git", *args],
+            capture_output=True,
+            text=True,
+            cwd=self.project_root,
+            env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"},
+            encoding='utf-8',
+            errors='replace'
+        )
+
+    def _index_signature(self) -> Optional[Tuple[int, int]]:
+        """.git/index の (mtime_ns, size)。取得できなければ None"""
+        try:
+            st = (self.project_root / ".git" / "index").stat()
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
 
-    def get_git_status(self) -> GitStatus:
-        """Git状態を取得"""
+    def get_git_status(self, force_refresh: bool = False) -> GitStatus:
+        """Git状態を取得（git status --porcelain を1回だけ実行）
 
-        def run_git(cmd: str) -> List[str]:
-            try:
-                result = subprocess.run(
-                    f"git {cmd}",
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    cwd=self.project_root,
-                    encoding='utf-8',
-                    errors='replace'
-                )
-                if result.returncode == 0:
-                    return [line.strip() for line in result.stdout.split('\n') if line.strip()]
-                return []
-            except Exception:
-                return []
+        .git/index が変わっておらず取得から _STATUS_CACHE_TTL 秒以内なら前回の結果を返す。
+        """
 
-        staged = run_git("diff --cached --name-only")
-        modified = run_git("diff --name-only")
-        untracked = run_git("ls-files --others --exclude-standard")
-        deleted = run_git("diff --name-only --diff-filter=D")
+        signature = self._index_signature()
+        cache = self._status_cache
+        if (not force_refresh and cache is not None and signature is not None
+                and cache[:2] == signature and time.monotonic() - cache[2] < _STATUS_CACHE_TTL):
+            return cache[3]
 
-        all_files = list(set(staged + modified + untracked + deleted))
+        staged: List[str] = []
+        modified: List[str] = []
+        untracked: List[str] = []
+        deleted: List[str] = []
 
-        return GitStatus(
+        try:
+            result = self._run_git(["status", "--porcelain=v1", "-z", "--untracked-files=all"])
+            entries = result.stdout.split('\0') if result.returncode == 0 else []
+        except Exception:
+            entries = []
+
+        # 各エントリは "XY path"。X=インデックス側, Y=ワークツリー側の状態
+        entries_iter = iter(entries)
+        for entry in entries_iter:
+            if len(entry) < 4:
+                continue
+            index_status, worktree_status, path = entry[0], entry[1], entry[3:]
+
+            # リネーム/コピーは直後に元パスが続くので読み飛ばす
+            if index_status in 'RC':
+                next(entries_iter, None)
+
+            if index_status == '?' and worktree_status == '?':
+                untracked.append(path)
+                continue
+            if index_status not in ' !':
+                staged.append(path)
+            if worktree_status not in ' !':
+                modified.append(path)
+            if worktree_status == 'D':
+                deleted.append(path)
+
+        status = GitStatus(
             staged=staged,
             modified=modified,
             untracked=untracked,
             deleted=deleted,
-            total_files=len(all_files)
+            total_files=len({*staged, *modified, *untracked, *deleted})
         )
 
-    def get_file_diff(self, file_path: str, staged: bool = True) -> str:
-        """ファイルの差分を取得"""
+        # git status 自体が index を更新することがあるので実行後の状態で記録
+        signature = self._index_signature()
+        if signature is not None:
+            self._status_cache = (*signature, time.monotonic(), status)
+        return status
+
+    def close(self):
+        """常駐gitプロセスを終了"""
+        self._git_worker.close()
+
+    def get_all_staged_diffs(self) -> Dict[str, FileDiff]:
+        """ステージ済み全ファイルの差分を1回の git diff で取得
+
+        --numstat -z の出力（ファイル順）とパッチ本体（同じ順）を対応付ける。
+        件数が合わない場合は順序での対応付けを諦め、ファイルごとに差分を取り直す。
+        """
+        try:
+            result = self._run_git(["diff", "--cached", "--numstat", "-z", "-p", "--no-color"])
+            if result.returncode != 0 or not result.stdout:
+                return {}
+        except Exception:
+            return {}
+
+        # numstat 部分は "\0\0" で終わり、その後ろがパッチ
+        numstat_part, _, patch_part = result.stdout.partition('\0\0')
+        tokens = iter(numstat_part.split('\0'))
+        stats: List[Tuple[str, int, int]] = []
+        for token in tokens:
+            fields = token.split('\t', 2)
+            if len(fields) != 3:
+                continue
+            added, removed, path = fields
+            if not path:
+                # リネーム/コピー: 元パス・新パスが後続トークン
+                next(tokens, None)
+                path = next(tokens, '')
+            # バイナリは "-" で表される
+            stats.append((path, int(added) if added != '-' else 0, int(removed) if removed != '-' else 0))
+
+        chunks = [chunk for chunk in _DIFF_HEADER_RE.split(patch_part) if chunk]
+        if len(chunks) != len(stats):
+            return {
+                path: FileDiff(path=path, diff=self.get_file_diff(path), added_lines=added, removed_lines=removed)
+                for path, added, removed in stats
+            }
+
+        return {
+            path: FileDiff(path=path, diff=chunk, added_lines=added, removed_lines=removed)
+            for (path, added, removed), chunk in zip(stats, chunks)
+        }
+
+    def get_file_diff(self, file_path: str, staged: bool = True,
+                      max_bytes: Optional[int] = None) -> str:
+        """ファイルの差分を取得
+
+        max_bytes を指定すると出力をその長さまでしか読まず、git は途中で止める。
+        末尾の途中までの行は捨てる。
+        """
+        args = ["diff", "--cached"] if staged else ["diff"]
+        if max_bytes is None:
+            try:
+                result = self._run_git([*args, "--", file_path])
+                return result.stdout if result.returncode == 0 else ""
+            except Exception:
+                return ""
+
         try:
-            cmd = "git diff --cached" if staged else "git diff"
-            result = subprocess.run(
-                f"{cmd} -- {file_path}",
-                shell=True,
-                capture_output=True,
-                text=True,
+            process = subprocess.Popen(
+                ["git", *args, "--", file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
                 cwd=self.project_root,
-                encoding='utf-8',
-                errors='replace'
+                env={**os.environ, "GIT_OPTIONAL_LOCKS": "0"}
             )
-            return result.stdout if result.returncode == 0 else ""
         except Exception:
             return ""
 
+        try:
+            data = process.stdout.read(max_bytes)
+            truncated = bool(process.stdout.read(1))
+            if truncated:
+                process.terminate()
+            else:
+                process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            process.stdout.close()
+
+        if truncated:
+            data = data[:data.rfind(b'\n') + 1]
+        elif process.returncode != 0:
+            return ""
+        return data.decode('utf-8', errors='replace')
+
+    def get_file_diff_preview(self, file_path: str) -> Tuple[str, int, int]:
+        """差分の先頭だけをデコードし、+/- 行数はストリームを読みながら数える
+
+        戻り値は (プレビュー, 追加行数, 削除行数)。差分全体が _DIFF_SUMMARY_THRESHOLD 文字以内なら
+        そのまま返し、超える場合は generate_commit_message と同じく
+        "Large diff: +N -M lines" 見出しと先頭 _DIFF_SUMMARY_LINES 行に要約する。
+        """
+        # 要約判定に必要な分だけ保持する（1文字は最大4バイト。先頭20行は常に保持）
+        max_head_bytes = _DIFF_SUMMARY_THRESHOLD * 4
+        head: List[bytes] = []
+        head_bytes = 0
+        truncated = False
+        in_hunk = False
+        added = removed = 0
+
+        try:
+            process = subprocess.Popen(
+                ["git", "diff", "--cached", "--", file_path],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=self.project_root
+            )
+        except Exception:
+            return "", 0, 0
+
+        try:
+            for line in process.stdout:
+                # "@@" 以降がハンク本体。"diff --git" から次の "@@" までは見出し
+                if in_hunk:
+                    if line.startswith(b'+'):
+                        added += 1
+                    elif line.startswith(b'-'):
+                        removed += 1
+                    elif line.startswith(b'diff --git '):
+                        in_hunk = False
+                elif line.startswith(b'@@'):
+                    in_hunk = True
+
+                if len(head) < _DIFF_SUMMARY_LINES or (
+                        not truncated and head_bytes + len(line) <= max_head_bytes):
+                    head.append(line)
+                    head_bytes += len(line)
+                else:
+                    truncated = True
+            process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+        if process.returncode != 0:
+            return "", 0, 0
+
+        preview = b''.join(head).decode('utf-8', errors='replace')
+        if truncated or len(preview) > _DIFF_SUMMARY_THRESHOLD:
+            preview = (f"Large diff: +{added} -{removed} lines\n"
+                       + '\n'.join(preview.split('\n', _DIFF_SUMMARY_LINES)[:_DIFF_SUMMARY_LINES]))
+        return preview, added, removed
+
     def stage_file(self, file_path: str) -> bool:
         """ファイルをステージング"""
         try:
             if not Path(self.project_root / file_path).exists():
                 # 削除されたファイル
-                cmd = f"git rm {file_path}"
+                args = ["rm", "--", file_path]
             else:
-                cmd = f"git add {file_path}"
+                args = ["add", "--", file_path]
 
-            result = subprocess.run(
-                cmd,
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=self.project_root,
-                encoding='utf-8',
-                errors='replace'
-            )
+            self._status_cache = None
+            result = self._run_git(args)
             return result.returncode == 0
         except Exception:
             return False
@@ -144,8 +436,44 @@ class GitAgent:
     def generate_commit_message(self,
                               file_path: str,
                               diff_content: str,
-                              mode: str = "normal") -> str:
-        """AIでコミットメッセージを生成"""
+                              mode: str = "normal",
+                              diff_stats: Optional[Tuple[int, int]] = None) -> str:
+        """AIでコミットメッセージを生成
+
+        diff_stats に (追加行数, 削除行数) を渡すと差分の再走査を省略する。
+        """
+
+        request, diff_content = self._build_commit_request(file_path, diff_content, mode, diff_stats)
+
+        # 同一リクエストの生成結果はキャッシュから返す
+        cache_key, cache_model = self._commit_cache_key(request)
+        cached = self._get_cached_message(cache_key, cache_model)
+        if cached:
+            return cached
+
+        try:
+            # LLMエージェントで生成
+            response = self.llm_agent.generate_text(request)
+
+            if response.is_success and response.content:
+                # フォーマット検証
+                message = response.content.strip()
+                if _is_valid_commit_message(message):
+                    self._put_cached_message(cache_key, cache_model, message, response.provider)
+                    return message
+
+        except Exception as e:
+            print(f"LLM生成エラー: {e}")
+
+        # 失敗した場合はスマートデフォルト
+        return self._generate_smart_default(file_path, diff_content)
+
+    def _build_commit_request(self,
+                              file_path: str,
+                              diff_content: str,
+                              mode: str = "normal",
+                              diff_stats: Optional[Tuple[int, int]] = None):
+        """コミットメッセージ生成用のLLMRequestと（要約済みの）差分を作成"""
 
         # プロンプトテンプレート取得
         if mode == "detailed":
@@ -154,13 +482,12 @@ class GitAgent:
             prompt = get_prompt_template("git_commit", "base_prompt")
 
         # 差分が大きい場合は要約
-        if len(diff_content) > 2000:
-            lines = diff_content.split('\n')
-            added_lines = len([l for l in lines if l.startswith('+')])
-            removed_lines = len([l for l in lines if l.startswith('-')])
+        if len(diff_content) > _DIFF_SUMMARY_THRESHOLD:
+            added_lines, removed_lines = diff_stats if diff_stats is not None else count_diff_lines(diff_content)
 
+            # 先頭20行だけ切り出す（全体は分割しない）
             diff_summary = f"Large diff: +{added_lines} -{removed_lines} lines\n"
-            diff_summary += '\n'.join(lines[:20])
+            diff_summary += '\n'.join(diff_content.split('\n', _DIFF_SUMMARY_LINES)[:_DIFF_SUMMARY_LINES])
             diff_content = diff_summary
 
         full_prompt = f"{prompt}\n\n==== 対象ファイル ====\n{file_path}\n\n==== 差分 ====\n{diff_content}"
@@ -174,21 +501,118 @@ class GitAgent:
             max_tokens=200,
             temperature=0.3
         )
+        return request, diff_content
 
+    def _commit_cache_key(self, request) -> Tuple[str, str]:
+        """リクエストのキャッシュキー（SHA-256）と対象モデル名を返す
+
+        設定済みプロバイダーのモデルを含めるため、モデル変更時は別キーになる。
+        """
+        model = ",".join(
+            f"{name}:{getattr(self.providers[name], 'model', '')}"
+            for name in self.llm_agent.provider_priority
+            if name in self.providers and self.providers[name].is_configured()
+        )
+        key_source = f"{request.system_message}|{request.prompt}|{model}|{request.max_tokens}|{request.temperature}"
+        return hashlib.sha256(key_source.encode('utf-8')).hexdigest(), model
+
+    def _get_cached_message(self, cache_key: str, cache_model: str) -> Optional[str]:
+        """キャッシュ済みメッセージを取得（DBエラーはキャッシュミス扱い）"""
         try:
-            # LLMエージェントで生成
-            response = self.llm_agent.generate_text(request)
+            return self.history_manager.get_cached(cache_key, cache_model, _COMMIT_CACHE_TTL_DAYS)
+        except Exception as e:
+            print(f"キャッシュ参照エラー: {e}")
+            return None
+
+    def _put_cached_message(self, cache_key: str, cache_model: str, message: str, provider: str) -> None:
+        """生成メッセージをキャッシュに保存（DBエラーは無視して生成結果を優先）"""
+        try:
+            self.history_manager.put_cached(
+                cache_key, cache_model, message,
+                provider=provider, ttl_days=_COMMIT_CACHE_TTL_DAYS
+            )
+        except Exception as e:
+            print(f"キャッシュ保存エラー: {e}")
+
+    def _call_provider(self, provider_name: str, request) -> Any:
+        """単一プロバイダーで生成し、結果を履歴に記録"""
+        start_time = time.time()
+        response = self.providers[provider_name].generate_text(
+            prompt=request.prompt,
+            system_message=request.system_message,
+            max_tokens=request.max_tokens,
+            temperature=request.temperature
+        )
+        self.llm_agent._log_request(
+            provider_name=provider_name,
+            request=request,
+            response=response,
+            response_time=time.time() - start_time
+        )
+        return response
+
+    def generate_commit_message_race(self,
+                                     file_path: str,
+                                     diff_content: str,
+                                     mode: str = "normal",
+                                     diff_stats: Optional[Tuple[int, int]] = None,
+                                     width: int = 2) -> str:
+        """優先順位上位 width 個の設定済みプロバイダーへ同時に投げ、最初の成功を採用
+
+        全て失敗した場合は、まだ試していないプロバイダーだけを優先順位順に試し、
+        それも失敗したらスマートデフォルトを返す（同じプロバイダーへ再送しない）。
+        実行中のHTTPリクエストは中断できないため、敗者の結果は破棄される。
+        """
+
+        configured = [
+            name for name in self.llm_agent.provider_priority
+            if name in self.providers and self.providers[name].is_configured()
+        ]
+        candidates, remaining = configured[:width], configured[width:]
+
+        if len(candidates) < 2:
+            return self.generate_commit_message(file_path, diff_content, mode, diff_stats)
+
+        request, _ = self._build_commit_request(file_path, diff_content, mode, diff_stats)
+        cache_key, cache_model = self._commit_cache_key(request)
+        cached = self._get_cached_message(cache_key, cache_model)
+        if cached:
+            return cached
+
+        futures = [_LLM_EXECUTOR.submit(self._call_provider, name, request) for name in candidates]
 
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=60):
+                try:
+                    response = future.result()
+                except Exception as e:
+                    print(f"LLM生成エラー: {e}")
+                    continue
+
+                if response.is_success and response.content:
+                    message = response.content.strip()
+                    if _is_valid_commit_message(message):
+                        self._put_cached_message(cache_key, cache_model, message, response.provider)
+                        return message
+        except concurrent.futures.TimeoutError:
+            pass
+        finally:
+            for future in futures:
+                future.cancel()
+
+        # 並列生成が全滅した場合は残りのプロバイダーを優先順位順に試す
+        for name in remaining:
+            try:
+                response = self._call_provider(name, request)
+            except Exception as e:
+                print(f"LLM生成エラー: {e}")
+                continue
             if response.is_success and response.content:
-                # フォーマット検証
                 message = response.content.strip()
-                if message.startswith(':') and len(message) <= 120:
+                if _is_valid_commit_message(message):
+                    self._put_cached_message(cache_key, cache_model, message, response.provider)
                     return message
 
-        except Exception as e:
-            print(f"LLM生成エラー: {e}")
-
-        # 失敗した場合はスマートデフォルト
         return self._generate_smart_default(file_path, diff_content)
 
     def _generate_smart_default(self, file_path: str, diff_content: str) -> str:
@@ -196,9 +620,7 @@ class GitAgent:
         filename = Path(file_path).name
 
         # 変更量で判定
-        lines = diff_content.split('\n')
-        added_lines = len([l for l in lines if l.startswith('+')])
-        removed_lines = len([l for l in lines if l.startswith('-')])
+        added_lines, removed_lines = count_diff_lines(diff_content)
 
         if added_lines > removed_lines * 2:
             prefix = ":add:"
@@ -217,24 +639,58 @@ class GitAgent:
         else:
             return f"{prefix} {filename} 更新"
 
+    def stage_files(self, file_paths: List[str]) -> bool:
+        """複数ファイルをまとめてステージング
+
+        git add -A は追加・変更・削除を1回で反映するので、通常はファイルの存在確認が不要。
+        存在しないパスが混じって失敗した場合のみ、存在確認して git add / git rm に分ける。
+        """
+        if not file_paths:
+            return True
+        self._status_cache = None
+        try:
+            if self._run_git(["add", "-A", "--", *file_paths]).returncode == 0:
+                return True
+        except Exception:
+            return False
+
+        existing = [path for path in file_paths if (self.project_root / path).exists()]
+        removed = [path for path in file_paths if not (self.project_root / path).exists()]
+
+        self._status_cache = None
+        try:
+            ok = True
+            if existing:
+                ok = self._run_git(["add", "--", *existing]).returncode == 0 and ok
+            if removed:
+                ok = self._run_git(["rm", "--quiet", "--ignore-unmatch", "--", *removed]).returncode == 0 and ok
+            return ok
+        except Exception:
+            return False
+
     def commit_file(self, file_path: str, message: str) -> bool:
         """ファイルをコミット"""
         try:
-            result = subprocess.run(
-                f'git commit -m "{message}"',
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=self.project_root,
-                encoding='utf-8',
-                errors='replace'
-            )
+            self._status_cache = None
+            result = self._run_git(["commit", "-m", message])
+            return result.returncode == 0
+        except Exception:
+            return False
+
+    def commit_files(self, file_paths: List[str], message: str) -> bool:
+        """指定ファイルだけを1回の git commit でコミット"""
+        try:
+            self._status_cache = None
+            result = self._run_git(["commit", "-m", message, "--", *file_paths])
             return result.returncode == 0
         except Exception:
             return False
 
-    def process_files(self, auto_commit: bool = False) -> Dict[str, Any]:
-        """ファイルを処理してコミットメッセージを生成"""
+    def process_files(self, auto_commit: bool = False, race: bool = False) -> Dict[str, Any]:
+        """ファイルを処理してコミットメッセージを生成
+
+        race=True の場合は上位プロバイダーを並列に呼び出す（コストは増える）。
+        """
 
         status = self.get_git_status()
         if status.total_files == 0:
@@ -242,25 +698,32 @@ class GitAgent:
 
         results = []
 
-        # ステージングされていないファイルをステージング
-        for file_path in status.modified + status.untracked:
-            if file_path not in status.staged:
-                self.stage_file(file_path)
+        # ステージングされていないファイルをまとめてステージング
+        staged_set = set(status.staged)
+        unstaged = [path for path in status.modified + status.untracked if path not in staged_set]
+        if unstaged:
+            self.stage_files(unstaged)
 
         # ステージされたファイルを処理
         updated_status = self.get_git_status()
+        staged_diffs = self.get_all_staged_diffs()
         for file_path in updated_status.staged:
-            diff_content = self.get_file_diff(file_path, staged=True)
-            if not diff_content:
+            file_diff = staged_diffs.get(file_path)
+            if not file_diff or not file_diff.diff:
                 continue
+            diff_content = file_diff.diff
 
             # コミットメッセージ生成
-            message = self.generate_commit_message(file_path, diff_content)
+            generate = self.generate_commit_message_race if race else self.generate_commit_message
+            message = generate(
+                file_path, diff_content,
+                diff_stats=(file_diff.added_lines, file_diff.removed_lines)
+            )
 
             file_result = {
                 "file": file_path,
                 "message": message,
-                "diff_lines": len(diff_content.split('\n')),
+                "diff_lines": diff_content.count('\n') + 1,
                 "committed": False
             }
 
@@ -306,9 +769,12 @@ class GitAgent:
                     parts = command.split()
                     if len(parts) > 1:
                         file_path = parts[1]
-                        diff_content = self.get_file_diff(file_path)
-                        if diff_content:
-                            message = self.generate_commit_message(file_path, diff_content)
+                        diff_preview, added_lines, removed_lines = self.get_file_diff_preview(file_path)
+                        if diff_preview:
+                            message = self.generate_commit_message(
+                                file_path, diff_preview,
+                                diff_stats=(added_lines, removed_lines)
+                            )
                             print(f"💬 生成メッセージ: {message}")
 
                             confirm = input("コミットしますか？ [y/N]: ")
@@ -330,8 +796,10 @@ class GitAgent:
             except Exception as e:
                 print(f"エラー: {e}")
 
-        # セッション終了
-        self.history_manager.end_session(self.session_id)
+        # セッション終了（開始済みの場合のみ）
+        if 'session_id' in self.__dict__:
+            self.history_manager.end_session(self.session_id)
+        self.close()
         print("👋 Git Agent 終了")
 
 
@@ -343,6 +811,7 @@ def main():
     parser.add_argument("--auto", action="store_true", help="自動コミットモード")
     parser.add_argument("--interactive", action="store_true", help="対話モード")
     parser.add_argument("--status", action="store_true", help="Git状態表示")
+    parser.add_argument("--race", action="store_true", help="上位プロバイダーを並列実行し最初の成功を採用")
 
     args = parser.parse_args()
 
@@ -360,8 +829,8 @@ def main():
 
     else:
         # デフォルト: ファイル処理
-        results = agent.process_files(auto_commit=args.auto)
-        print(json.dumps(results, ensure_ascii=False, indent=2))
+        results = agent.process_files(auto_commit=args.auto, race=args.race)
+        print_json(results)
 
 
 if __name__ == "__main__":
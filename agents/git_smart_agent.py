@@ -9,23 +9,344 @@ Git Smart Agent - 高機能Git管理エージェント
 """
 
 import os
+import re
 import sys
 import json
 import subprocess
 import shutil
+import errno
+import difflib
+import io
+import codecs
+import time
+import hashlib
+import itertools
+import concurrent.futures
+from functools import cached_property
 from pathlib import Path
-from typing import Dict, List, Optional, Any, Tuple
-from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Set, Tuple, Mapping
+from dataclasses import dataclass, replace
 from datetime import datetime
 
+# pyahocorasick があればファイル分類の部分一致判定を1パスのオートマトンで行う
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+# curses があれば整理確認を一覧画面での複数選択にする（Windows 等で無ければ従来の逐次確認）
+try:
+    import curses
+except ImportError:
+    curses = None
+
+# pygit2 (libgit2) があればリモート状態・差分取得をプロセス起動なしで行う
+try:
+    import pygit2
+except ImportError:
+    pygit2 = None
+
 # プロジェクトパスを追加
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from agents.git_agent import GitAgent, GitStatus
+from agents.git_agent import GitAgent, GitStatus, _STATUS_CACHE_TTL
+
+
+# 整理対象の走査で中に入らないディレクトリ（Git管理領域・アーカイブ済み・仮想環境）
+_WALK_SKIP_DIRS = frozenset({".git", "_archive", ".venv", "venv", "node_modules", ".tox", ".nox"})
+
+# git config --get-regexp の "remote.<名前>.<url|pushurl> <値>" 行
+_REMOTE_CONFIG_RE = re.compile(r'^remote\.(.+)\.(url|pushurl) (.*)$', re.M)
+
+# コミットメッセージのクリーニング用（絵文字・Markdown記号・連続空白）
+_EMOJI_RE = re.compile("[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002702-\U000027B0\U000024C2-\U0001F251]+")
+_MD_PUNCT_RE = re.compile(r'[*`]')
+_WS_RE = re.compile(r'\s+')
+# コミットメッセージとして受け付ける prefix
+_VALID_PREFIX_RE = re.compile(r':(?:add|fix|update|refactor|docs|test|config|remove):')
+
+# difflib で差分を組み立てる blob の上限（difflib は行数に対して二乗で遅くなるため、
+# これを超えるファイルは git diff に任せる）
+_INPROCESS_DIFF_MAX_BYTES = 256 * 1024
+_INPROCESS_DIFF_MAX_LINES = 2000
+
+# difflib で差分を組み立てられるモード（通常ファイル・実行ファイル・シンボリックリンク）
+_BLOB_MODES = frozenset({'100644', '100755', '120000'})
 
+# 読み取り専用の git 問い合わせを同時に投げるための共有スレッドプール
+_GIT_QUERY_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="git-smart-query")
 
-@dataclass
+# 整理確認で次のファイルの情報を先読みするためのスレッドプール
+_PREVIEW_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix="git-smart-preview")
+
+# コミットメッセージ生成の並列数（LLM呼び出し・サブプロセス待ちが中心のためスレッドで十分）
+_COMMIT_WORKERS = min(32, (os.cpu_count() or 4) * 2)
+
+
+def _split_diff_lines(text: str) -> List[str]:
+    """改行を残したまま行に分割（git と同じく '\\n' のみを行区切りとする）"""
+    lines = [line + '\n' for line in text.split('\n')]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _glob_to_regex(pattern: str) -> str:
+    """Path.glob 相当のパターンを正規表現に変換（* / ? は '/' を跨がない）"""
+    parts = []
+    for char in pattern:
+        if char == '*':
+            parts.append('[^/]*')
+        elif char == '?':
+            parts.append('[^/]')
+        else:
+            parts.append(re.escape(char))
+    return ''.join(parts)
+
+
+# ファイル分類パターン（部分一致）
+_CRITICAL_PATTERNS = ("__init__.py", "requirements.txt", "setup.py", "config.yaml", "llm_cli.py")
+_TEST_PATTERNS = (
+    "test_", "_test.py", "tests/",
+    "debug_", "simple_", "validate_",
+    "run_tests", "mcp_test"
+)
+_CONFIG_PATTERNS = (".yaml", ".yml", ".json", ".cfg", ".ini", "config/", ".env")
+_CLEANUP_PATTERNS = (
+    "LINUX_", "TEST_", "COMPLETION_",
+    ".backup", "_backup",
+    "git_status_helper.py",
+    "fix_", "debug_"
+)
+_FEATURE_PATTERNS = ("agents/", "services/", "tools/", ".py")
+
+
+def _substring_re(patterns: Tuple[str, ...]) -> str:
+    return "|".join(map(re.escape, patterns))
+
+
+# カテゴリ別の判定正規表現（docs は「拡張子が .md/.rst/.txt かつ test を含まない」）
+_CLASSIFY_RES = {
+    "critical": re.compile(_substring_re(_CRITICAL_PATTERNS)),
+    "tests": re.compile(_substring_re(_TEST_PATTERNS)),
+    "docs": re.compile(r"(?!.*(?i:test)).*\.(?:md|rst|txt)\Z", re.DOTALL),
+    "config": re.compile(_substring_re(_CONFIG_PATTERNS)),
+    "cleanup": re.compile(_substring_re(_CLEANUP_PATTERNS)),
+    "features": re.compile(_substring_re(_FEATURE_PATTERNS)),
+}
+
+# 全カテゴリを優先順に1つにまとめた正規表現。先頭位置の先読みを順に試すので
+# 最初に成立したカテゴリ名が lastgroup になる
+_CLASSIFY_RE = re.compile("|".join(
+    f"(?=(?:{regex.pattern}))(?P<{name}>)" if name == "docs"
+    else f"(?=.*?(?:{regex.pattern}))(?P<{name}>)"
+    for name, regex in _CLASSIFY_RES.items()
+), re.DOTALL)
+
+# 判定順（_CLASSIFY_RES の並び）と、部分一致パターン → 判定順の最小値のオートマトン
+_CLASSIFY_ORDER = tuple(_CLASSIFY_RES)
+_DOCS_RANK = _CLASSIFY_ORDER.index("docs")
+
+
+def _build_classify_automaton():
+    if ahocorasick is None:
+        return None
+    ranks: Dict[str, int] = {}
+    for name, patterns in (("critical", _CRITICAL_PATTERNS), ("tests", _TEST_PATTERNS),
+                           ("config", _CONFIG_PATTERNS), ("cleanup", _CLEANUP_PATTERNS),
+                           ("features", _FEATURE_PATTERNS)):
+        rank = _CLASSIFY_ORDER.index(name)
+        for pattern in patterns:
+            ranks[pattern] = min(ranks.get(pattern, rank), rank)
+    automaton = ahocorasick.Automaton()
+    for pattern, rank in ranks.items():
+        automaton.add_word(pattern, rank)
+    automaton.make_automaton()
+    return automaton
+
+
+_CLASSIFY_AUTOMATON = _build_classify_automaton()
+
+# これより多いファイル数のときだけ分類をプロセスプールで並列化する
+_PARALLEL_CLASSIFY_THRESHOLD = 5000
+
+
+def _classify_batch(paths: List[str]) -> List[str]:
+    """パスの並びをカテゴリ名の並びに変換（プロセスプールから呼ぶためモジュール関数）"""
+    if _CLASSIFY_AUTOMATON is None:
+        match = _CLASSIFY_RE.match
+        return [m.lastgroup if m else "other" for m in map(match, paths)]
+
+    # 全パターンを1回の走査で拾い、最も優先度の高いカテゴリを選ぶ
+    # （docs だけは拡張子判定なので、より優先のカテゴリに当たらなかった場合に正規表現で確認）
+    iter_hits = _CLASSIFY_AUTOMATON.iter
+    docs_match = _CLASSIFY_RES["docs"].match
+    names = []
+    for path in paths:
+        rank = min((hit for _, hit in iter_hits(path)), default=len(_CLASSIFY_ORDER))
+        if rank > _DOCS_RANK and docs_match(path):
+            rank = _DOCS_RANK
+        names.append(_CLASSIFY_ORDER[rank] if rank < len(_CLASSIFY_ORDER) else "other")
+    return names
+
+
+# ディレクトリ内アイテム数の表示上限（これを超えたら数え切らずに "N+" と表示）
+_TREE_COUNT_LIMIT = 1000
+
+
+def _iter_tree(root: str):
+    """root 配下のアイテムを root からの相対パスで列挙（.git は辿らない）"""
+    for dir_path, dir_names, file_names in os.walk(root, topdown=True):
+        if ".git" in dir_names:
+            dir_names.remove(".git")
+        rel_dir = os.path.relpath(dir_path, root)
+        for name in dir_names + file_names:
+            yield name if rel_dir == "." else os.path.join(rel_dir, name)
+
+
+def _count_tree(root: str) -> int:
+    """ディレクトリ内のアイテム数（_TREE_COUNT_LIMIT を超えたら _TREE_COUNT_LIMIT + 1 で打ち切り）"""
+    return sum(1 for _ in itertools.islice(_iter_tree(root), _TREE_COUNT_LIMIT + 1))
+
+
+def _format_tree_count(count: int, skipped: int = 0) -> str:
+    """_count_tree の結果を表示用に整形（打ち切った場合は "N+"。skipped 件を差し引いて表示）"""
+    if count > _TREE_COUNT_LIMIT:
+        return f"{_TREE_COUNT_LIMIT - skipped}+"
+    return str(count - skipped)
+
+
+# 整理確認の入力（先頭1文字）と処理の対応
+_CLEANUP_CHOICES = {'y': "accept", 'n': "skip", 'v': "view", 'q': "quit"}
+
+# 内容プレビューを表示する拡張子
+_PREVIEW_SUFFIXES = frozenset({'.py', '.md', '.txt', '.yaml', '.yml', '.json'})
+
+
+def _read_preview(path: str, size: int) -> str:
+    """ファイル先頭 size バイトを UTF-8 として読む（バッファ付きリーダーを使わず1回の read）
+
+    末尾で途切れたマルチバイト文字は捨て、不正なバイトは置換文字にする。
+    """
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = os.read(fd, size)
+    finally:
+        os.close(fd)
+    return codecs.getincrementaldecoder('utf-8')(errors='replace').decode(data, final=False)
+
+
+def _stat_and_preview(path: str, size: int = 200) -> Tuple[Optional[int], str]:
+    """(ファイルサイズ, 内容プレビュー)。存在しなければ (None, "")"""
+    try:
+        file_size = os.stat(path).st_size
+    except OSError:
+        return None, ""
+    # 空ファイル・対象外の拡張子は読まない
+    if not file_size or os.path.splitext(path)[1] not in _PREVIEW_SUFFIXES:
+        return file_size, ""
+    try:
+        return file_size, _read_preview(path, size)
+    except OSError:
+        return file_size, ""
+
+
+def _select_actions_tui(stdscr, lines: List[str]) -> Optional[List[bool]]:
+    """curses の一覧画面で項目を複数選択（Enter で確定した選択状態、q で None）
+
+    ↑↓/j k で移動、Space で選択切替、a で全選択切替。表示文字列は呼び出し側で作成済み。
+    """
+    curses.curs_set(0)
+    selected = [False] * len(lines)
+    cursor = top = 0
+    header = "🧹 整理対象を選択: Space=選択  a=全選択  Enter=実行  q=中止"
+    while True:
+        height, width = stdscr.getmaxyx()
+        rows = max(1, height - 2)
+        top = min(max(top, cursor - rows + 1), cursor)
+
+        stdscr.erase()
+        stdscr.addnstr(0, 0, f"{header}  ({sum(selected)}/{len(lines)})", width - 1)
+        for row, index in enumerate(range(top, min(top + rows, len(lines))), 1):
+            mark = "[x]" if selected[index] else "[ ]"
+            attr = curses.A_REVERSE if index == cursor else curses.A_NORMAL
+            stdscr.addnstr(row, 0, f"{mark} {lines[index]}", width - 1, attr)
+        stdscr.refresh()
+
+        key = stdscr.getch()
+        if key in (curses.KEY_UP, ord('k')):
+            cursor = max(0, cursor - 1)
+        elif key in (curses.KEY_DOWN, ord('j')):
+            cursor = min(len(lines) - 1, cursor + 1)
+        elif key == curses.KEY_PPAGE:
+            cursor = max(0, cursor - rows)
+        elif key == curses.KEY_NPAGE:
+            cursor = min(len(lines) - 1, cursor + rows)
+        elif key == ord(' '):
+            selected[cursor] = not selected[cursor]
+        elif key == ord('a'):
+            selected = [not all(selected)] * len(lines)
+        elif key in (curses.KEY_ENTER, ord('\n'), ord('\r')):
+            return selected
+        elif key in (ord('q'), 27):
+            return None
+
+
+def _write_stdout(buf: io.StringIO) -> None:
+    """バッファした表示を1回の write で標準出力へ書き出す"""
+    sys.stdout.write(buf.getvalue())
+    sys.stdout.flush()
+
+
+# ファイル整理ルール（内容は固定なので読み取り専用にしてインスタンス間で共有）
+_CLEANUP_RULES: Mapping[str, Any] = MappingProxyType({
+    "merge_patterns": MappingProxyType({
+        "test_*.py": "tests/",
+        "*_test.py": "tests/",
+        "debug_*.py": "_archive/debug/",
+        "simple_*": "_archive/simple/",
+        "validate_*.py": "_archive/validation/"
+    }),
+    "delete_patterns": (
+        "*.tmp",
+        "*.bak",
+        "__pycache__/*",
+        "*.pyc",
+        ".DS_Store"
+    ),
+    "priority_files": (
+        "README.md",
+        "requirements.txt",
+        "setup.py",
+        "config/*.yaml",
+        "agents/__init__.py",
+        "services/__init__.py"
+    )
+})
+
+# 削除パターンを1つの正規表現にまとめる（グループ名 p<番号> でどのパターンか判別）
+# パターンは任意の階層の末尾パスに一致させる（"*.pyc" はサブディレクトリ内も対象）
+_DELETE_RE = re.compile("(?:.*/)?(?:" + "|".join(
+    f"(?P<p{i}>{_glob_to_regex(pattern)})"
+    for i, pattern in enumerate(_CLEANUP_RULES["delete_patterns"])
+) + r")\Z", re.DOTALL)
+
+# カテゴリ定義: (名前, 優先度, 説明, マージ対象か, マージ先)
+_CATEGORY_SPECS = (
+    ("critical", 1, "重要なコアファイル", False, None),
+    ("features", 2, "新機能・改善", False, None),
+    ("docs", 3, "ドキュメント", False, None),
+    ("tests", 4, "テスト関連", True, "tests/"),
+    ("config", 5, "設定ファイル", False, None),
+    ("cleanup", 6, "整理・削除対象", True, "_archive/"),
+    ("other", 7, "その他", False, None),
+)
+
+
+@dataclass(slots=True)
 class FileCategory:
     """ファイルカテゴリ情報"""
     name: str
@@ -36,230 +357,582 @@ class FileCategory:
     merge_target: Optional[str] = None
 
 
+@dataclass(slots=True)
+class DiffStats:
+    """差分1件を1パスで走査した結果"""
+    added: int
+    removed: int
+    keywords: Set[str]
+    preview: List[str]
+    digest: bytes
+
+
+# 対話モードの remote / push で check_remote_status の結果を使い回す秒数
+_REMOTE_STATUS_TTL = 5.0
+
+# 対話コミットで読み込む差分の上限（プロンプトに載せるのは先頭1〜2KB程度）
+_DIFF_MAX_BYTES = 64 * 1024
+
+# 主な変更のプレビューは差分の先頭この行数から拾う
+_DIFF_PREVIEW_LINES = 20
+
+
+# 追加行のキーワード判定（1本の正規表現で全語を一度に探す）
+_KW_RE = re.compile(
+    r"(?P<cfg>config|設定|setting)|(?P<test>test|テスト)|(?P<fix>fix|修正|bug)"
+    r"|(?P<add>add|追加|new)|(?P<doc>readme|doc|ドキュメント)",
+    re.I,
+)
+# グループ名 -> キーワード（並び順が判定の優先順位）
+_KW_LABELS = {
+    'cfg': '設定変更',
+    'test': 'テスト',
+    'fix': 'バグ修正',
+    'add': '機能追加',
+    'doc': 'ドキュメント',
+}
+_KW_RANK = {group: rank for rank, group in enumerate(_KW_LABELS)}
+
+
+def _diff_keyword(content: str) -> Optional[str]:
+    """追加行1行からキーワードを判定"""
+    if 'def ' in content:
+        return '関数追加'
+    if 'class ' in content:
+        return 'クラス追加'
+    if 'import ' in content:
+        return 'インポート追加'
+    # 同じ行に複数の語があれば優先順位の高いものを採る
+    group = min((m.lastgroup for m in _KW_RE.finditer(content)),
+                key=_KW_RANK.__getitem__, default=None)
+    return _KW_LABELS[group] if group else None
+
+
+def _scan_diff(diff_content: str) -> DiffStats:
+    """差分を1回だけ走査し、増減行数・キーワード・主な変更プレビューをまとめて集計"""
+    added = removed = 0
+    keywords = set()
+    preview = []
+    for index, line in enumerate(diff_content.splitlines()):
+        if line.startswith('+'):
+            if line.startswith('+++'):
+                continue
+            added += 1
+            sign = '+'
+            content = line[1:].strip()
+            keyword = _diff_keyword(content)
+            if keyword:
+                keywords.add(keyword)
+        elif line.startswith('-'):
+            if line.startswith('---'):
+                continue
+            removed += 1
+            sign = '-'
+            content = line[1:].strip()
+        else:
+            continue
+        if index < _DIFF_PREVIEW_LINES and content and not content.startswith('#'):
+            preview.append(f"{sign} {content[:60]}")
+    digest = hashlib.blake2b(diff_content.encode('utf-8', 'surrogateescape'), digest_size=16).digest()
+    return DiffStats(added, removed, keywords, preview, digest)
+
+
+class _PreviewPrefetcher:
+    """ユーザーが現在のファイルを確認している間に、後続ファイルの stat とプレビューを先読みする"""
+
+    def __init__(self, paths: List[str], ahead: int = 3):
+        self._paths = paths
+        self._ahead = ahead
+        self._futures: Dict[int, concurrent.futures.Future] = {}
+
+    def get(self, index: int) -> Tuple[Optional[int], str]:
+        """index 番目の (サイズ, プレビュー)。先読みが終わっていなければその場で取得"""
+        for i in range(index + 1, min(index + 1 + self._ahead, len(self._paths))):
+            if i not in self._futures:
+                self._futures[i] = _PREVIEW_EXECUTOR.submit(_stat_and_preview, self._paths[i])
+        future = self._futures.pop(index, None)
+        if future is not None and future.done():
+            return future.result()
+        if future is not None:
+            future.cancel()
+        return _stat_and_preview(self._paths[index])
+
+
 class GitSmartAgent(GitAgent):
     """スマートGit管理エージェント"""
 
-    def __init__(self, config_path: str = None):
+    def __init__(self, config_path: str = None, jobs: Optional[int] = None):
         super().__init__(config_path)
+        # 大規模リポジトリでの分類に使うプロセス数（None は CPU 数、1 で並列化しない）
+        self.jobs = jobs if jobs is not None else (os.cpu_count() or 1)
         self.cleanup_rules = self._load_cleanup_rules()
-        
-    def _load_cleanup_rules(self) -> Dict[str, Any]:
-        """ファイル整理ルール"""
-        return {
-            "merge_patterns": {
-                "test_*.py": "tests/",
-                "*_test.py": "tests/",
-                "debug_*.py": "_archive/debug/",
-                "simple_*": "_archive/simple/",
-                "validate_*.py": "_archive/validation/"
-            },
-            "delete_patterns": [
-                "*.tmp",
-                "*.bak",
-                "__pycache__/*",
-                "*.pyc",
-                ".DS_Store"
-            ],
-            "priority_files": [
-                "README.md",
-                "requirements.txt",
-                "setup.py",
-                "config/*.yaml",
-                "agents/__init__.py",
-                "services/__init__.py"
-            ]
-        }
+        # ループ内では Path を組み立てず文字列で扱う
+        self._project_root_str = str(self.project_root)
+
+        # analyze_files の結果: (git status 出力のハッシュ, カテゴリ一覧)
+        self._analysis_cache: Optional[Tuple[bytes, List[FileCategory]]] = None
+        # git status 出力: (index の mtime_ns, index のサイズ, 取得時刻, 出力)
+        self._snapshot_cache: Optional[Tuple[int, int, float, bytes]] = None
+        # git diff --cached --raw の結果: (index の mtime_ns, index のサイズ, 取得時刻, {パス: エントリ})
+        self._staged_entries_cache: Optional[Tuple[int, int, float, Dict[str, Tuple[str, str, str, str, str]]]] = None
+        # check_remote_status の結果: (取得時の time.monotonic(), 結果)
+        self._remote_status_cache: Optional[Tuple[float, Dict[str, Any]]] = None
+        # LLM生成メッセージ: {(種別, パス, 差分ハッシュ, 直近の却下案): メッセージ}
+        self._llm_cache: Dict[Tuple[str, str, bytes, Tuple[str, ...]], str] = {}
+
+        self._delete_re = _DELETE_RE
+        
+    @cached_property
+    def _repo(self):
+        """pygit2 のリポジトリ（pygit2 未導入・オープン失敗時は None）"""
+        if pygit2 is None:
+            return None
+        try:
+            return pygit2.Repository(str(self.project_root))
+        except (pygit2.GitError, KeyError, ValueError):
+            return None
+
+    def _load_cleanup_rules(self) -> Mapping[str, Any]:
+        """ファイル整理ルール（モジュール共通の定数）"""
+        return _CLEANUP_RULES
+
+    def get_file_diff(self, file_path: str, staged: bool = True,
+                      max_bytes: Optional[int] = None) -> str:
+        """ステージ済み差分を常駐 cat-file プロセスから取得したblobで生成
+
+        HEAD と index の blob を difflib で比較するため、ファイルごとの git diff 起動が不要。
+        大きなファイル・バイナリ・モード変更・リネーム/コピー・サブモジュールやワークツリー差分は
+        通常の git diff にフォールバック。
+        max_bytes を指定すると、その長さに収まる行までで差分の組み立てを打ち切る。
+        git diff にフォールバックする大きなファイルは出力を max_bytes までしか読まないので、
+        差分全体をメモリに載せることはない。
+        """
+        if not staged or '\n' in file_path:
+            return super().get_file_diff(file_path, staged, max_bytes)
+
+        entry = self._staged_entries().get(file_path)
+        if entry is None:
+            return ""
+        old_mode, new_mode, old_oid, new_oid, change = entry
+        if (change not in 'AMD'
+                or (change != 'A' and old_mode not in _BLOB_MODES)
+                or (change != 'D' and new_mode not in _BLOB_MODES)
+                or (change == 'M' and old_mode != new_mode)):
+            return super().get_file_diff(file_path, staged, max_bytes)
+
+        old, new = self._read_staged_blobs(None if change == 'A' else old_oid,
+                                           None if change == 'D' else new_oid,
+                                           _INPROCESS_DIFF_MAX_BYTES)
+        # 上限超過で読まなかった側がある・バイナリ・行数が多すぎる場合は git diff に任せる
+        if ((old is None and change != 'A') or (new is None and change != 'D')
+                or any(blob is not None and (b'\0' in blob or blob.count(b'\n') > _INPROCESS_DIFF_MAX_LINES)
+                       for blob in (old, new))):
+            return super().get_file_diff(file_path, staged, max_bytes)
+
+        old_lines = _split_diff_lines(old.decode('utf-8', errors='replace')) if old is not None else []
+        new_lines = _split_diff_lines(new.decode('utf-8', errors='replace')) if new is not None else []
+
+        header = f"diff --git a/{file_path} b/{file_path}\n"
+        if change == 'A':
+            header += f"new file mode {new_mode}\n"
+        elif change == 'D':
+            header += f"deleted file mode {old_mode}\n"
+
+        body = difflib.unified_diff(
+            old_lines, new_lines,
+            fromfile=f"a/{file_path}" if old is not None else "/dev/null",
+            tofile=f"b/{file_path}" if new is not None else "/dev/null",
+            lineterm="\n"
+        )
+        # 末尾改行なしの行は git と同じ注記を付ける
+        lines = (line if line.endswith('\n') else line + '\n\\ No newline at end of file\n'
+                 for line in body)
+        if max_bytes is None:
+            return header + "".join(lines)
+
+        parts = [header]
+        size = len(header.encode('utf-8'))
+        for line in lines:
+            size += len(line.encode('utf-8', 'surrogateescape'))
+            if size > max_bytes:
+                break
+            parts.append(line)
+        return "".join(parts)
+
+    def _staged_entries(self) -> Dict[str, Tuple[str, str, str, str, str]]:
+        """git diff --cached --raw の結果を {パス: (旧モード, 新モード, 旧blob, 新blob, 種別)} で返す
+
+        種別は A/M/D/R/C/T などの1文字。リネーム/コピーは移動先のパスで登録する。
+        .git/index が変わっておらず取得から _STATUS_CACHE_TTL 秒以内なら前回の結果を返す。
+        """
+        signature = self._index_signature()
+        cache = self._staged_entries_cache
+        if (cache is not None and signature is not None
+                and cache[:2] == signature and time.monotonic() - cache[2] < _STATUS_CACHE_TTL):
+            return cache[3]
+
+        result = self._run_git(["diff", "--cached", "--raw", "-z", "--no-abbrev", "-M"])
+        entries: Dict[str, Tuple[str, str, str, str, str]] = {}
+        if result.returncode != 0:
+            return entries
+
+        # 各エントリは ":old_mode new_mode old_oid new_oid status\0path\0"（R/C はパスが2つ）
+        tokens = iter(result.stdout.split('\0'))
+        for meta in tokens:
+            if not meta.startswith(':'):
+                continue
+            old_mode, new_mode, old_oid, new_oid, change = meta[1:].split()
+            path = next(tokens, '')
+            if change[0] in 'RC':
+                path = next(tokens, '')
+            entries[path] = (old_mode, new_mode, old_oid, new_oid, change[0])
+
+        signature = self._index_signature()
+        if signature is not None:
+            self._staged_entries_cache = (*signature, time.monotonic(), entries)
+        return entries
+
+    def _read_staged_blobs(self, old_oid: Optional[str], new_oid: Optional[str],
+                           max_size: int) -> Tuple[Optional[bytes], Optional[bytes]]:
+        """(HEAD 側の内容, index 側の内容)。oid が None の側・max_size を超える側は None
+
+        pygit2 があればプロセス内で読み、なければ常駐 cat-file プロセスを使う。
+        どちらもサイズはヘッダだけで判定し、大きな blob の内容は展開しない。
+        """
+        repo = self._repo
+        if repo is None:
+            def read(oid):
+                return self._git_worker.read_object(oid, max_size)
+        else:
+            def read(oid):
+                try:
+                    if repo.odb.read_header(oid)[1] > max_size:
+                        return None
+                    return repo[oid].data
+                except (KeyError, ValueError):
+                    return None
+        return (read(old_oid) if old_oid else None,
+                read(new_oid) if new_oid else None)
+
+    def _status_snapshot(self, force_refresh: bool = False) -> bytes:
+        """git status --porcelain=v2 -z の生出力
+
+        get_git_status と analyze_files で共有し、.git/index が変わっておらず
+        取得から _STATUS_CACHE_TTL 秒以内なら git を起動せず前回の出力を返す。
+        """
+        signature = self._index_signature()
+        cache = self._snapshot_cache
+        if (not force_refresh and cache is not None and signature is not None
+                and cache[:2] == signature and time.monotonic() - cache[2] < _STATUS_CACHE_TTL):
+            return cache[3]
+
+        result = subprocess.run(
+            ["git", "--no-optional-locks", "status", "--porcelain=v2", "-z", "--untracked-files=all"],
+            capture_output=True,
+            cwd=self.project_root
+        )
+        snapshot = result.stdout if result.returncode == 0 else b""
+
+        signature = self._index_signature()
+        if signature is not None and result.returncode == 0:
+            self._snapshot_cache = (*signature, time.monotonic(), snapshot)
+        return snapshot
+
+    def _invalidate_status(self):
+        """git status 出力・Git状態・分析結果・リモート状態のキャッシュを破棄"""
+        self._snapshot_cache = None
+        self._staged_entries_cache = None
+        self._status_cache = None
+        self._analysis_cache = None
+        self._remote_status_cache = None
+
+    def get_git_status(self, force_refresh: bool = False) -> GitStatus:
+        """Git状態を取得（analyze_files と同じ git status 出力から組み立てる）"""
+        staged: List[str] = []
+        modified: List[str] = []
+        untracked: List[str] = []
+        deleted: List[str] = []
+
+        # porcelain v2 の XY は変更なしが "."（未追跡は "??"）
+        for code, path in self._iter_status_entries(self._status_snapshot(force_refresh)):
+            if code == '??':
+                untracked.append(path)
+                continue
+            if code == '!!':
+                continue
+            index_status, worktree_status = code[0], code[1]
+            if index_status != '.':
+                staged.append(path)
+            if worktree_status != '.':
+                modified.append(path)
+            if worktree_status == 'D':
+                deleted.append(path)
+
+        return GitStatus(
+            staged=staged,
+            modified=modified,
+            untracked=untracked,
+            deleted=deleted,
+            total_files=len({*staged, *modified, *untracked, *deleted})
+        )
+
+    @staticmethod
+    def _iter_status_entries(snapshot: bytes):
+        """porcelain v2 -z 出力から (状態コード, パス) を順に返す
+
+        リネーム/コピー（"2" エントリ）は移動先パスのみ。ヘッダ行（"#"）は読み飛ばす。
+        """
+        tokens = iter(snapshot.split(b'\0'))
+        for token in tokens:
+            if not token:
+                continue
+            kind = token[:1]
+            if kind == b'1':
+                fields = token.split(b' ', 8)
+            elif kind == b'2':
+                fields = token.split(b' ', 9)
+                next(tokens, None)  # 元パス
+            elif kind == b'u':
+                fields = token.split(b' ', 10)
+            elif kind in b'?!':
+                yield kind.decode() * 2, token[2:].decode('utf-8', errors='replace')
+                continue
+            else:
+                continue
+            yield fields[1].decode(), fields[-1].decode('utf-8', errors='replace')
 
     def analyze_files(self) -> List[FileCategory]:
-        """ファイルを分析してカテゴリ分け"""
-        status = self.get_git_status()
-        all_files = status.staged + status.modified + status.untracked
-        
+        """ファイルを分析してカテゴリ分け（git status の出力が前回と同じなら結果を再利用）
+
+        戻り値は空でないカテゴリのみで、優先度（priority）の昇順に並んでいる。
+        """
+        snapshot = self._status_snapshot()
+        if not snapshot:
+            # 変更なし（クリーンな作業ツリー）
+            return []
+        digest = hashlib.blake2b(snapshot, digest_size=16).digest()
+        if self._analysis_cache is None or self._analysis_cache[0] != digest:
+            self._analysis_cache = (digest, self._categorize_files(snapshot))
+
+        # 呼び出し側がリストを変更してもキャッシュに影響しないようコピーを返す
+        return [replace(cat, files=list(cat.files)) for cat in self._analysis_cache[1]]
+
+    def commit_file(self, file_path: str, message: str) -> bool:
+        """ファイルをコミット（成功時は分析結果を破棄）"""
+        success = super().commit_file(file_path, message)
+        if success:
+            self._invalidate_status()
+        return success
+
+    def commit_files(self, file_paths: List[str], message: str) -> bool:
+        """指定ファイルをまとめてコミット（成功時は分析結果を破棄）"""
+        success = super().commit_files(file_paths, message)
+        if success:
+            self._invalidate_status()
+        return success
+
+    def _categorize_files(self, snapshot: bytes) -> List[FileCategory]:
+        """git status の出力を1パスで読みながら変更ファイルをカテゴリ分け"""
         categories = [
-            FileCategory("critical", 1, [], "重要なコアファイル"),
-            FileCategory("features", 2, [], "新機能・改善"),
-            FileCategory("docs", 3, [], "ドキュメント"),
-            FileCategory("tests", 4, [], "テスト関連", True, "tests/"),
-            FileCategory("config", 5, [], "設定ファイル"),
-            FileCategory("cleanup", 6, [], "整理・削除対象", True, "_archive/"),
-            FileCategory("other", 7, [], "その他")
+            FileCategory(name, priority, [], description, should_merge, merge_target)
+            for name, priority, description, should_merge, merge_target in _CATEGORY_SPECS
         ]
         
         # ファイル分類
-        for file_path in all_files:
-            path = Path(file_path)
-            
-            # カテゴリ判定
-            if self._is_critical_file(file_path):
-                categories[0].files.append(file_path)
-            elif self._is_test_file(file_path):
-                categories[3].files.append(file_path)
-            elif self._is_doc_file(file_path):
-                categories[2].files.append(file_path)
-            elif self._is_config_file(file_path):
-                categories[4].files.append(file_path)
-            elif self._is_cleanup_file(file_path):
-                categories[5].files.append(file_path)
-            elif self._is_feature_file(file_path):
-                categories[1].files.append(file_path)
-            else:
-                categories[6].files.append(file_path)
+        by_name = {cat.name: cat.files for cat in categories}
+        paths = [file_path for _, file_path in self._iter_status_entries(snapshot)]
+        for file_path, name in zip(paths, self._classify_paths(paths)):
+            by_name[name].append(file_path)
         
         return [cat for cat in categories if cat.files]
 
-    def _is_critical_file(self, file_path: str) -> bool:
-        """重要ファイル判定"""
-        critical_patterns = [
-            "__init__.py",
-            "requirements.txt", 
-            "setup.py",
-            "config.yaml",
-            "llm_cli.py"
-        ]
-        return any(pattern in file_path for pattern in critical_patterns)
-        
-    def _is_test_file(self, file_path: str) -> bool:
-        """テストファイル判定"""
-        test_patterns = [
-            "test_", "_test.py", "tests/",
-            "debug_", "simple_", "validate_",
-            "run_tests", "mcp_test"
-        ]
-        return any(pattern in file_path for pattern in test_patterns)
-        
-    def _is_doc_file(self, file_path: str) -> bool:
-        """ドキュメントファイル判定"""
-        return file_path.endswith(('.md', '.rst', '.txt')) and 'test' not in file_path.lower()
-        
-    def _is_config_file(self, file_path: str) -> bool:
-        """設定ファイル判定"""
-        config_patterns = [
-            ".yaml", ".yml", ".json", ".cfg", ".ini",
-            "config/", ".env"
-        ]
-        return any(pattern in file_path for pattern in config_patterns)
-        
-    def _is_cleanup_file(self, file_path: str) -> bool:
-        """整理対象ファイル判定"""
-        cleanup_patterns = [
-            "LINUX_", "TEST_", "COMPLETION_",
-            ".backup", "_backup", 
-            "git_status_helper.py",
-            "fix_", "debug_"
-        ]
-        return any(pattern in file_path for pattern in cleanup_patterns)
-        
-    def _is_feature_file(self, file_path: str) -> bool:
-        """機能ファイル判定"""
-        feature_patterns = [
-            "agents/", "services/", "tools/",
-            ".py"
-        ]
-        return any(pattern in file_path for pattern in feature_patterns)
+    def _classify_paths(self, paths: List[str]) -> List[str]:
+        """各パスのカテゴリ名。ファイル数が多い場合はプロセスプールで分割して判定"""
+        if self.jobs <= 1 or len(paths) <= _PARALLEL_CLASSIFY_THRESHOLD:
+            return _classify_batch(paths)
 
-    def cleanup_files(self, dry_run: bool = True, interactive: bool = False) -> Dict[str, Any]:
-        """ファイル整理実行"""
-        actions = []
+        # プロセス間通信の回数を抑えるため、ワーカーあたり約4チャンクにまとめて渡す
+        size = max(1, len(paths) // (self.jobs * 4))
+        chunks = [paths[i:i + size] for i in range(0, len(paths), size)]
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=self.jobs) as executor:
+                return [name for names in executor.map(_classify_batch, chunks) for name in names]
+        except (OSError, concurrent.futures.process.BrokenProcessPool):
+            return _classify_batch(paths)
+
+    def _classify_file(self, file_path: str) -> str:
+        """カテゴリ名を判定（判定順は critical → tests → docs → config → cleanup → features）"""
+        return _classify_batch([file_path])[0]
+
+    def cleanup_files(self, dry_run: bool = True, interactive: bool = False,
+                      categories: Optional[List[FileCategory]] = None) -> Dict[str, Any]:
+        """ファイル整理実行
+
+        categories に analyze_files() の結果を渡すと再分析を省略する。
+        """
+        move_actions, delete_actions = self._plan_cleanup(categories)
+        return self._apply_cleanup(move_actions, delete_actions, dry_run=dry_run, interactive=interactive)
+
+    def _plan_cleanup(self, categories: Optional[List[FileCategory]] = None
+                      ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """整理アクションの一覧 (移動, 削除) を作成（ファイルは変更しない）"""
+        # 移動・削除は作成時点で別リストに分けておき、表示や確認で再フィルタしない
+        move_actions: List[Dict[str, Any]] = []
+        delete_actions: List[Dict[str, Any]] = []
+        
+        if categories is None:
+            categories = self.analyze_files()
         
         # マージ対象を移動
-        for category in self.analyze_files():
+        root = self._project_root_str
+        for category in categories:
             if category.should_merge and category.merge_target:
-                target_dir = self.project_root / category.merge_target
+                # 移動先の接頭辞はカテゴリごとに1回だけ求める
+                target_prefix = category.merge_target.rstrip('/') + '/'
                 
                 for file_path in category.files:
-                    source = self.project_root / file_path
-                    if source.exists():
-                        target = target_dir / Path(file_path).name
+                    # 既に移動先配下にあるファイルは対象外（同じ場所への移動や二重アーカイブを防ぐ）
+                    if file_path.startswith(target_prefix):
+                        continue
+                    if os.path.exists(os.path.join(root, file_path)):
+                        target = target_prefix + file_path.rsplit('/', 1)[-1]
                         
                         action = {
                             "type": "move",
-                            "source": str(source.relative_to(self.project_root)),
-                            "target": str(target.relative_to(self.project_root)),
+                            "source": file_path,
+                            "target": target,
                             "category": category.name,
                             "reason": f"{category.description}ファイルを適切なディレクトリに整理"
                         }
-                        actions.append(action)
-        
-        # 削除対象
-        for pattern in self.cleanup_rules["delete_patterns"]:
-            for file_path in self.project_root.glob(pattern):
-                if file_path.exists() and file_path.relative_to(self.project_root) != Path("."):
-                    action = {
-                        "type": "delete",
-                        "target": str(file_path.relative_to(self.project_root)),
-                        "reason": f"不要ファイル（{pattern}パターン）"
-                    }
-                    actions.append(action)
+                        move_actions.append(action)
+        
+        # 削除対象（1回の走査で全パターンを判定し、パターン順に並べる）
+        delete_patterns = self.cleanup_rules["delete_patterns"]
+        matches: List[List[str]] = [[] for _ in delete_patterns]
+        for rel_path in self._walk_project(prune=self._delete_re.match):
+            match = self._delete_re.match(rel_path)
+            if match:
+                matches[int(match.lastgroup[1:])].append(rel_path)
+
+        for pattern, rel_paths in zip(delete_patterns, matches):
+            for rel_path in rel_paths:
+                action = {
+                    "type": "delete",
+                    "target": rel_path,
+                    "reason": f"不要ファイル（{pattern}パターン）"
+                }
+                delete_actions.append(action)
         
+        return move_actions, delete_actions
+
+    def _apply_cleanup(self, move_actions: List[Dict[str, Any]], delete_actions: List[Dict[str, Any]],
+                       dry_run: bool = False, interactive: bool = False) -> Dict[str, Any]:
+        """_plan_cleanup で作成したアクションを（確認の上で）実行し、cleanup_files と同じ形式で返す"""
         # 対話的確認
-        if interactive and actions:
-            actions = self._interactive_cleanup_confirmation(actions)
+        if interactive and (move_actions or delete_actions):
+            move_actions, delete_actions = self._interactive_cleanup_confirmation(move_actions, delete_actions)
+        actions = move_actions + delete_actions
         
-        # 実行
+        # 実行（移動先ディレクトリは先にまとめて作成）
         if not dry_run and actions:
+            target_dirs = {action["target"].rpartition('/')[0] for action in move_actions}
+            for target_dir in target_dirs:
+                os.makedirs(os.path.join(self._project_root_str, target_dir), exist_ok=True)
+            
             for action in actions:
                 self._execute_cleanup_action(action)
+            # ファイル構成が変わったので分析結果と git status のキャッシュを破棄
+            self._invalidate_status()
         
         return {
             "dry_run": dry_run,
             "actions": actions,
+            "move_actions": move_actions,
+            "delete_actions": delete_actions,
             "total_actions": len(actions)
         }
         
-    def _interactive_cleanup_confirmation(self, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """対話的整理確認"""
+    def _walk_project(self, prune=None):
+        """プロジェクト内のエントリを '/' 区切りの相対パスで再帰的に列挙
+
+        再帰呼び出しせずに os.scandir のスタックで走査する。_WALK_SKIP_DIRS のディレクトリと、
+        prune(相対パス) が真になるディレクトリ（削除対象そのもの等）の中には入らない。
+        """
+        stack: List[Tuple[str, str]] = [(str(self.project_root), "")]
+        while stack:
+            dir_path, prefix = stack.pop()
+            try:
+                with os.scandir(dir_path) as entries:
+                    for entry in entries:
+                        rel_path = prefix + entry.name
+                        yield rel_path
+                        if (entry.name not in _WALK_SKIP_DIRS
+                                and entry.is_dir(follow_symlinks=False)
+                                and not (prune and prune(rel_path))):
+                            stack.append((entry.path, rel_path + "/"))
+            except OSError:
+                continue
+
+    def _interactive_cleanup_confirmation(
+            self, move_actions: List[Dict[str, Any]], delete_actions: List[Dict[str, Any]]
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """対話的整理確認（承認された (移動, 削除) を返す）
+
+        端末で curses が使える場合は一覧画面でまとめて選択し、それ以外は1件ずつ確認する。
+        """
+        if curses is not None and sys.stdin.isatty() and sys.stdout.isatty():
+            lines = [f"📁 移動  {action['source']} → {action['target']}" for action in move_actions]
+            lines += [f"🗑️  削除  {action['target']}  ({action['reason']})" for action in delete_actions]
+            try:
+                selected = curses.wrapper(_select_actions_tui, lines)
+            except curses.error:
+                selected = False  # 端末が対応していなければ逐次確認へ
+            if selected is None:
+                print("❌ 整理をキャンセルしました")
+                return [], []
+            if selected is not False:
+                split = len(move_actions)
+                return ([a for a, keep in zip(move_actions, selected[:split]) if keep],
+                        [a for a, keep in zip(delete_actions, selected[split:]) if keep])
+
         print("\n" + "="*60)
         print("🧹 ファイル整理詳細確認")
         print("="*60)
         
-        confirmed_actions = []
-        
-        # カテゴリ別にグループ化
-        move_actions = [a for a in actions if a["type"] == "move"]
-        delete_actions = [a for a in actions if a["type"] == "delete"]
+        confirmed_moves: List[Dict[str, Any]] = []
+        confirmed_deletes: List[Dict[str, Any]] = []
         
         if move_actions:
             print(f"\n📦 移動対象: {len(move_actions)}件")
             print("-" * 40)
             
+            prefetcher = _PreviewPrefetcher([
+                os.path.join(self._project_root_str, action['source']) for action in move_actions
+            ])
             for i, action in enumerate(move_actions, 1):
                 print(f"\n[{i}/{len(move_actions)}] 📁 ファイル移動")
                 print(f"   📄 ファイル: {action['source']}")
                 print(f"   ➡️  移動先: {action['target']}")
                 print(f"   💡 理由: {action['reason']}")
                 
-                # ファイル詳細情報
-                source_path = self.project_root / action['source']
-                if source_path.exists():
-                    file_size = source_path.stat().st_size
+                # ファイル詳細情報（先読み済みならその結果を使う）
+                file_size, preview = prefetcher.get(i - 1)
+                if file_size is not None:
                     print(f"   📊 サイズ: {file_size:,} bytes")
                     
                     # ファイル内容プレビュー
-                    if source_path.suffix in ['.py', '.md', '.txt', '.yaml', '.yml']:
-                        try:
-                            with open(source_path, 'r', encoding='utf-8') as f:
-                                preview = f.read(200)
-                                print(f"   👀 プレビュー: {preview[:100]}...")
-                        except:
-                            pass
+                    if preview:
+                        print(f"   👀 プレビュー: {preview[:100]}...")
                 
-                while True:
-                    choice = input("\n   [y=移動する / n=スキップ / v=内容確認 / q=整理中止]: ").lower()
-                    
-                    if choice == 'y':
-                        confirmed_actions.append(action)
-                        print("   ✅ 移動対象に追加")
-                        break
-                    elif choice == 'n':
-                        print("   ⏭️  スキップ")
-                        break
-                    elif choice == 'v':
-                        self._show_file_details(action['source'])
-                    elif choice == 'q':
-                        print("❌ 整理をキャンセルしました")
-                        return []
-                    else:
-                        print("   ❓ y/n/v/q のいずれかを入力してください")
+                choice = self._prompt_cleanup_choice("移動する", action['source'])
+                if choice == "quit":
+                    print("❌ 整理をキャンセルしました")
+                    return [], []
+                if choice == "accept":
+                    confirmed_moves.append(action)
+                    print("   ✅ 移動対象に追加")
+                else:
+                    print("   ⏭️  スキップ")
         
         if delete_actions:
             print(f"\n🗑️  削除対象: {len(delete_actions)}件")
@@ -277,32 +950,23 @@ class GitSmartAgent(GitAgent):
                         file_size = target_path.stat().st_size
                         print(f"   📊 サイズ: {file_size:,} bytes")
                     elif target_path.is_dir():
-                        file_count = len(list(target_path.rglob("*")))
-                        print(f"   📊 ディレクトリ内: {file_count}個のアイテム")
+                        print(f"   📊 ディレクトリ内: {_format_tree_count(_count_tree(str(target_path)))}個のアイテム")
                 
-                while True:
-                    choice = input("\n   [y=削除する / n=スキップ / v=内容確認 / q=整理中止]: ").lower()
-                    
-                    if choice == 'y':
-                        confirmed_actions.append(action)
-                        print("   ✅ 削除対象に追加")
-                        break
-                    elif choice == 'n':
-                        print("   ⏭️  スキップ")
-                        break
-                    elif choice == 'v':
-                        self._show_file_details(action['target'])
-                    elif choice == 'q':
-                        print("❌ 整理をキャンセルしました")
-                        return []
-                    else:
-                        print("   ❓ y/n/v/q のいずれかを入力してください")
+                choice = self._prompt_cleanup_choice("削除する", action['target'])
+                if choice == "quit":
+                    print("❌ 整理をキャンセルしました")
+                    return [], []
+                if choice == "accept":
+                    confirmed_deletes.append(action)
+                    print("   ✅ 削除対象に追加")
+                else:
+                    print("   ⏭️  スキップ")
         
         # 最終確認
-        if confirmed_actions:
-            print(f"\n📋 最終確認: {len(confirmed_actions)}件のアクションを実行")
-            move_count = len([a for a in confirmed_actions if a["type"] == "move"])
-            delete_count = len([a for a in confirmed_actions if a["type"] == "delete"])
+        if confirmed_moves or confirmed_deletes:
+            move_count = len(confirmed_moves)
+            delete_count = len(confirmed_deletes)
+            print(f"\n📋 最終確認: {move_count + delete_count}件のアクションを実行")
             
             if move_count:
                 print(f"   📦 移動: {move_count}件")
@@ -312,9 +976,24 @@ class GitSmartAgent(GitAgent):
             final_choice = input("\n実行しますか？ [y/N]: ").lower()
             if final_choice != 'y':
                 print("❌ 整理をキャンセルしました")
-                return []
+                return [], []
         
-        return confirmed_actions
+        return confirmed_moves, confirmed_deletes
+
+    def _prompt_cleanup_choice(self, accept_label: str, file_path: str) -> str:
+        """整理アクション1件の確認入力（"accept" / "skip" / "quit" を返す。v は詳細表示して再入力）
+
+        入力の先頭1文字で判定するので "yes" なども受け付ける。
+        """
+        prompt = f"\n   [y={accept_label} / n=スキップ / v=内容確認 / q=整理中止]: "
+        while True:
+            choice = _CLEANUP_CHOICES.get(input(prompt).strip().lower()[:1])
+            if choice == "view":
+                self._show_file_details(file_path)
+            elif choice is not None:
+                return choice
+            else:
+                print("   ❓ y/n/v/q のいずれかを入力してください")
 
     def _show_file_details(self, file_path: str):
         """ファイル詳細表示"""
@@ -330,19 +1009,19 @@ class GitSmartAgent(GitAgent):
         # 基本情報
         stat = full_path.stat()
         print(f"📊 サイズ: {stat.st_size:,} bytes")
-        print(f"📅 更新日: {datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"📅 更新日: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(stat.st_mtime))}")
         
         # ファイル内容
         if full_path.is_file():
             try:
-                if full_path.suffix in ['.py', '.md', '.txt', '.yaml', '.yml', '.json']:
-                    with open(full_path, 'r', encoding='utf-8') as f:
-                        content = f.read(1000)  # 最初の1000文字
-                        print(f"\n📖 内容プレビュー:")
-                        print("-" * 30)
-                        print(content)
-                        if len(content) == 1000:
-                            print("... (省略)")
+                if full_path.suffix in _PREVIEW_SUFFIXES:
+                    # 最初の1000バイト（サイズは上の stat の結果を使う）
+                    content = _read_preview(str(full_path), 1000) if stat.st_size else ""
+                    print(f"\n📖 内容プレビュー:")
+                    print("-" * 30)
+                    print(content)
+                    if stat.st_size > 1000:
+                        print("... (省略)")
                 elif full_path.suffix in ['.png', '.jpg', '.jpeg', '.gif']:
                     print("🖼️  画像ファイル")
                 else:
@@ -350,13 +1029,14 @@ class GitSmartAgent(GitAgent):
             except Exception as e:
                 print(f"❌ 読み込みエラー: {e}")
         elif full_path.is_dir():
-            files = list(full_path.rglob("*"))
-            print(f"📁 ディレクトリ: {len(files)}個のアイテム")
-            for item in files[:10]:
-                rel_item = item.relative_to(full_path)
+            # 先頭10件だけ取り出し、件数は上限付きで数える
+            items = list(itertools.islice(_iter_tree(str(full_path)), 10))
+            count = _count_tree(str(full_path))
+            print(f"📁 ディレクトリ: {_format_tree_count(count)}個のアイテム")
+            for rel_item in items:
                 print(f"   - {rel_item}")
-            if len(files) > 10:
-                print(f"   ... 他 {len(files)-10}個")
+            if count > 10:
+                print(f"   ... 他 {_format_tree_count(count, 10)}個")
         
         print("-" * 50)
 
@@ -364,14 +1044,22 @@ class GitSmartAgent(GitAgent):
         """整理アクション実行"""
         try:
             if action["type"] == "move":
-                source_path = self.project_root / action["source"]
-                target_path = self.project_root / action["target"]
-                
-                # ターゲットディレクトリ作成
-                target_path.parent.mkdir(parents=True, exist_ok=True)
+                source_path = os.path.join(self._project_root_str, action["source"])
+                target_path = os.path.join(self._project_root_str, action["target"])
                 
-                # 移動実行
-                shutil.move(str(source_path), str(target_path))
+                # 移動実行（同一ファイルシステムなら os.replace 1回。別デバイスの場合のみ shutil.move）
+                try:
+                    os.replace(source_path, target_path)
+                except FileNotFoundError:
+                    # 移動先ディレクトリが未作成（単独で呼ばれた場合など）
+                    if not os.path.exists(source_path):
+                        raise
+                    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+                    os.replace(source_path, target_path)
+                except OSError as e:
+                    if e.errno != errno.EXDEV:
+                        raise
+                    shutil.move(source_path, target_path)
                 print(f"   ✅ 移動完了: {action['source']} → {action['target']}")
                 
             elif action["type"] == "delete":
@@ -388,34 +1076,37 @@ class GitSmartAgent(GitAgent):
             print(f"   ❌ エラー: {action.get('source', action.get('target'))}: {e}")
 
     def _show_detailed_cleanup_preview(self, cleanup_result: Dict[str, Any]):
-        """詳細整理プレビュー表示"""
+        """詳細整理プレビュー表示（出力はまとめて1回で書き込む）"""
         if cleanup_result['total_actions'] == 0:
             print("✨ 整理の必要なファイルはありません")
             return
         
-        print(f"\n🧹 詳細整理プレビュー: {cleanup_result['total_actions']}件")
-        print("=" * 60)
+        buf = io.StringIO()
+        print(f"\n🧹 詳細整理プレビュー: {cleanup_result['total_actions']}件", file=buf)
+        print("=" * 60, file=buf)
         
         # アクション種別でグループ化
-        move_actions = [a for a in cleanup_result["actions"] if a["type"] == "move"]
-        delete_actions = [a for a in cleanup_result["actions"] if a["type"] == "delete"]
+        move_actions = cleanup_result["move_actions"]
+        delete_actions = cleanup_result["delete_actions"]
         
         if move_actions:
-            print(f"\n📦 移動対象: {len(move_actions)}件")
-            print("-" * 40)
+            print(f"\n📦 移動対象: {len(move_actions)}件", file=buf)
+            print("-" * 40, file=buf)
             for i, action in enumerate(move_actions, 1):
-                print(f"{i:2d}. 📁 {action['source']}")
-                print(f"     ➡️  {action['target']}")
-                print(f"     💡 {action['reason']}")
-                print()
+                print(f"{i:2d}. 📁 {action['source']}", file=buf)
+                print(f"     ➡️  {action['target']}", file=buf)
+                print(f"     💡 {action['reason']}", file=buf)
+                print(file=buf)
         
         if delete_actions:
-            print(f"\n🗑️  削除対象: {len(delete_actions)}件")
-            print("-" * 40)
+            print(f"\n🗑️  削除対象: {len(delete_actions)}件", file=buf)
+            print("-" * 40, file=buf)
             for i, action in enumerate(delete_actions, 1):
-                print(f"{i:2d}. 🗑️  {action['target']}")
-                print(f"     💡 {action['reason']}")
-                print()
+                print(f"{i:2d}. 🗑️  {action['target']}", file=buf)
+                print(f"     💡 {action['reason']}", file=buf)
+                print(file=buf)
+        
+        _write_stdout(buf)
 
     def show_cleanup_help(self):
         """整理ヘルプ表示"""
@@ -491,69 +1182,55 @@ class GitSmartAgent(GitAgent):
 
     def check_remote_status(self) -> Dict[str, Any]:
         """リモートリポジトリ状態確認"""
+        if self._repo is not None:
+            try:
+                return self._check_remote_status_pygit2()
+            except pygit2.GitError:
+                pass
         try:
-            # リモート確認
-            result = subprocess.run(
-                "git remote -v",
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=self.project_root
-            )
+            # リモート設定とステータスは独立しているので同時に問い合わせる
+            # "# branch.ab +<ahead> -<behind>" は上流ブランチがある場合のみ出力される
+            # 未追跡ファイルの走査は大規模リポジトリで支配的なので省く（全走査は analyze_files のみ）
+            status_future = _GIT_QUERY_EXECUTOR.submit(
+                self._run_git, ["status", "--porcelain=v2", "--branch", "--untracked-files=no"])
             
-            if result.returncode != 0 or not result.stdout.strip():
+            # リモート確認（url / pushurl を設定から一括取得）
+            result = self._run_git(["config", "--get-regexp", r"^remote\..*\.(url|pushurl)$"])
+            
+            urls: Dict[str, Dict[str, str]] = {}
+            for name, kind, value in _REMOTE_CONFIG_RE.findall(result.stdout):
+                urls.setdefault(name, {})[kind] = value
+            
+            if not urls:
                 return {
                     "has_remote": False,
                     "remotes": [],
                     "suggestion": "リモートリポジトリが設定されていません"
                 }
             
-            # リモート解析
+            # git remote -v と同じ形式（fetch / push の2行ずつ）
             remotes = []
-            for line in result.stdout.split('\n'):
-                if line.strip():
-                    parts = line.split()
-                    if len(parts) >= 3:
-                        remotes.append({
-                            "name": parts[0],
-                            "url": parts[1],
-                            "type": parts[2]
-                        })
-            
-            # ステータス確認
-            status_result = subprocess.run(
-                "git status --porcelain",
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=self.project_root
-            )
+            for name, remote_urls in urls.items():
+                url = remote_urls.get("url", "")
+                remotes.append({"name": name, "url": url, "type": "(fetch)"})
+                remotes.append({"name": name, "url": remote_urls.get("pushurl", url), "type": "(push)"})
             
-            has_changes = bool(status_result.stdout.strip())
+            # ステータス・先行コミット数（1回の git status で取得済み）
+            status_result = status_future.result()
             
-            # プッシュ可能性確認
-            can_push = False
+            has_changes = False
             ahead_count = 0
-            
-            try:
-                ahead_result = subprocess.run(
-                    "git rev-list --count @{u}..HEAD",
-                    shell=True,
-                    capture_output=True,
-                    text=True,
-                    cwd=self.project_root
-                )
-                if ahead_result.returncode == 0:
-                    ahead_count = int(ahead_result.stdout.strip())
-                    can_push = ahead_count > 0
-            except:
-                pass
+            for line in status_result.stdout.splitlines():
+                if line.startswith("# branch.ab "):
+                    ahead_count = int(line.split()[2].lstrip('+'))
+                elif line and not line.startswith('#'):
+                    has_changes = True
             
             return {
                 "has_remote": True,
                 "remotes": remotes,
                 "has_changes": has_changes,
-                "can_push": can_push,
+                "can_push": ahead_count > 0,
                 "ahead_count": ahead_count
             }
             
@@ -564,6 +1241,46 @@ class GitSmartAgent(GitAgent):
                 "suggestion": f"Git状態確認エラー: {e}"
             }
 
+    def _check_remote_status_pygit2(self) -> Dict[str, Any]:
+        """check_remote_status の pygit2 版（戻り値の形式は同じ）"""
+        repo = self._repo
+        remotes = []
+        for remote in repo.remotes:
+            url = remote.url or ""
+            remotes.append({"name": remote.name, "url": url, "type": "(fetch)"})
+            remotes.append({"name": remote.name, "url": remote.push_url or url, "type": "(push)"})
+
+        if not remotes:
+            return {
+                "has_remote": False,
+                "remotes": [],
+                "suggestion": "リモートリポジトリが設定されていません"
+            }
+
+        # 未追跡・無視ファイルは変更として扱わない（git status --untracked-files=no 相当）
+        try:
+            status = repo.status(untracked_files="no")
+        except TypeError:
+            # untracked_files 引数のない古い pygit2
+            status = repo.status()
+        ignored = pygit2.GIT_STATUS_IGNORED | pygit2.GIT_STATUS_WT_NEW
+        has_changes = any(flags & ~ignored for flags in status.values())
+
+        # 上流ブランチがある場合のみ先行コミット数を数える
+        ahead_count = 0
+        if not repo.head_is_unborn and not repo.head_is_detached:
+            upstream = repo.branches.local[repo.head.shorthand].upstream
+            if upstream is not None:
+                ahead_count, _ = repo.ahead_behind(repo.head.target, upstream.target)
+
+        return {
+            "has_remote": True,
+            "remotes": remotes,
+            "has_changes": has_changes,
+            "can_push": ahead_count > 0,
+            "ahead_count": ahead_count
+        }
+
     def smart_commit_workflow(self, auto_push: bool = False, interactive: bool = True) -> Dict[str, Any]:
         """スマートコミットワークフロー - 対話的・段階的コミット"""
         workflow_results = {
@@ -595,7 +1312,9 @@ class GitSmartAgent(GitAgent):
         if interactive:
             print("\n🧹 Phase 2: ファイル整理提案")
             try:
-                cleanup_preview = self.cleanup_files(dry_run=True)
+                # アクションは1回だけ作成し、プレビューと実行で使い回す
+                cleanup_plan = self._plan_cleanup(categories)
+                cleanup_preview = self._apply_cleanup(*cleanup_plan, dry_run=True)
                 
                 if cleanup_preview and cleanup_preview.get("total_actions", 0) > 0:
                     self._show_detailed_cleanup_preview(cleanup_preview)
@@ -609,12 +1328,12 @@ class GitSmartAgent(GitAgent):
                     
                     if choice == 'y':
                         print("🧹 対話的ファイル整理開始...")
-                        executed_result = self.cleanup_files(dry_run=False, interactive=True)
+                        executed_result = self._apply_cleanup(*cleanup_plan, interactive=True)
                         if executed_result and executed_result.get('total_actions', 0) > 0:
                             print(f"✅ 整理完了: {executed_result['total_actions']}件処理")
                     elif choice == 'a':
                         print("🧹 自動ファイル整理実行中...")
-                        executed_result = self.cleanup_files(dry_run=False)
+                        executed_result = self._apply_cleanup(*cleanup_plan)
                         if executed_result:
                             print("✅ 自動整理完了")
                     else:
@@ -635,6 +1354,10 @@ class GitSmartAgent(GitAgent):
         }
         workflow_results["phases"].append(phase2)
         
+        # 整理でファイルが移動・削除された場合のみ再分析（それ以外は Phase 1 の結果を使い回す）
+        if phase2["executed"]:
+            categories = self.analyze_files()
+        
         # Phase 3: 対話的コミット
         print("\n📝 Phase 3: 段階的コミット")
         commit_results = self._interactive_commit_process(categories, interactive)
@@ -672,88 +1395,90 @@ class GitSmartAgent(GitAgent):
         return workflow_results
 
     def _show_git_status_and_recommendations(self):
-        """Git状況とおすすめアクションを表示"""
-        print("=" * 60)
-        print("🚀 Git Smart Agent - インテリジェント Git 管理")
-        print("=" * 60)
-        
-        # Git基本情報
+        """Git状況とおすすめアクションを表示（出力はまとめて1回で書き込む）"""
+        buf = io.StringIO()
+        print("=" * 60, file=buf)
+        print("🚀 Git Smart Agent - インテリジェント Git 管理", file=buf)
+        print("=" * 60, file=buf)
+        
+        # Git基本情報（ブランチ・リモートの問い合わせは status と並行して実行）
+        branch_future = _GIT_QUERY_EXECUTOR.submit(
+            self._run_git, ["branch", "--show-current"])
+        remote_future = _GIT_QUERY_EXECUTOR.submit(
+            self._run_git, ["remote", "get-url", "origin"])
         status = self.get_git_status()
         
         try:
-            current_branch = subprocess.run(
-                "git branch --show-current",
-                shell=True, capture_output=True, text=True, cwd=self.project_root
-            ).stdout.strip() or "detached"
+            current_branch = branch_future.result().stdout.strip() or "detached"
             
-            remote_info = subprocess.run(
-                "git remote get-url origin",
-                shell=True, capture_output=True, text=True, cwd=self.project_root
-            ).stdout.strip() or "未設定"
+            remote_info = remote_future.result().stdout.strip() or "未設定"
             
         except:
             current_branch = "unknown"
             remote_info = "unknown"
         
-        print(f"📍 ブランチ: {current_branch}")
-        print(f"🌐 リモート: {remote_info}")
-        print(f"📁 変更ファイル: {status.total_files}件")
-        print(f"   - Staged: {len(status.staged)}件")
-        print(f"   - Modified: {len(status.modified)}件") 
-        print(f"   - Untracked: {len(status.untracked)}件")
+        print(f"📍 ブランチ: {current_branch}", file=buf)
+        print(f"🌐 リモート: {remote_info}", file=buf)
+        print(f"📁 変更ファイル: {status.total_files}件", file=buf)
+        print(f"   - Staged: {len(status.staged)}件", file=buf)
+        print(f"   - Modified: {len(status.modified)}件", file=buf)
+        print(f"   - Untracked: {len(status.untracked)}件", file=buf)
         if status.deleted:
-            print(f"   - Deleted: {len(status.deleted)}件")
+            print(f"   - Deleted: {len(status.deleted)}件", file=buf)
         
-        print("\n💡 おすすめアクション:")
+        print("\n💡 おすすめアクション:", file=buf)
         if status.total_files == 0:
-            print("   ✅ 変更なし - 作業お疲れさまでした！")
+            print("   ✅ 変更なし - 作業お疲れさまでした！", file=buf)
         elif status.total_files <= 5:
-            print("   📝 ファイル数が少ないので、個別に丁寧なコミットがおすすめ")
+            print("   📝 ファイル数が少ないので、個別に丁寧なコミットがおすすめ", file=buf)
         elif status.total_files <= 20:
-            print("   🔄 適度なファイル数です。カテゴリ別にまとめてコミット")
+            print("   🔄 適度なファイル数です。カテゴリ別にまとめてコミット", file=buf)
         else:
-            print("   🧹 ファイル数が多いです。整理してからのコミットを強く推奨")
+            print("   🧹 ファイル数が多いです。整理してからのコミットを強く推奨", file=buf)
         
         if len(status.untracked) > len(status.modified):
-            print("   🆕 新規ファイルが多数あります。重要度順にコミットしましょう")
+            print("   🆕 新規ファイルが多数あります。重要度順にコミットしましょう", file=buf)
         
-        print("\n🛠️  利用可能なコマンド:")
-        print("   📊 analyze  - ファイル分析・カテゴリ分け")
-        print("   🧹 cleanup  - ファイル整理・統合")
-        print("   📝 workflow - 完全対話的コミット（推奨）")
-        print("   🌐 remote   - リモート状況確認")
-        print("   ❓ help     - 詳細ヘルプ")
+        print("\n🛠️  利用可能なコマンド:", file=buf)
+        print("   📊 analyze  - ファイル分析・カテゴリ分け", file=buf)
+        print("   🧹 cleanup  - ファイル整理・統合", file=buf)
+        print("   📝 workflow - 完全対話的コミット（推奨）", file=buf)
+        print("   🌐 remote   - リモート状況確認", file=buf)
+        print("   ❓ help     - 詳細ヘルプ", file=buf)
+        _write_stdout(buf)
 
     def _show_analysis_results(self, categories: List[FileCategory]):
-        """ファイル分析結果表示"""
-        print("\n📊 ファイル分析結果:")
-        print("-" * 50)
+        """ファイル分析結果表示（出力はまとめて1回で書き込む）"""
+        buf = io.StringIO()
+        print("\n📊 ファイル分析結果:", file=buf)
+        print("-" * 50, file=buf)
         
         total_files = sum(len(cat.files) for cat in categories)
         
-        for category in sorted(categories, key=lambda x: x.priority):
+        for category in categories:
             if not category.files:
                 continue
                 
             percentage = (len(category.files) / total_files) * 100
             priority_icon = "🔥" if category.priority <= 2 else "⚡" if category.priority <= 4 else "📁"
             
-            print(f"{priority_icon} {category.description}: {len(category.files)}件 ({percentage:.1f}%)")
+            print(f"{priority_icon} {category.description}: {len(category.files)}件 ({percentage:.1f}%)", file=buf)
             
             # 重要ファイルは詳細表示
             if category.priority <= 2:
                 for file in category.files[:5]:
-                    print(f"     - {file}")
+                    print(f"     - {file}", file=buf)
                 if len(category.files) > 5:
-                    print(f"     ... 他 {len(category.files)-5}件")
+                    print(f"     ... 他 {len(category.files)-5}件", file=buf)
             elif len(category.files) <= 3:
                 for file in category.files:
-                    print(f"     - {file}")
+                    print(f"     - {file}", file=buf)
             else:
-                print(f"     - {category.files[0]} ... 他 {len(category.files)-1}件")
+                print(f"     - {category.files[0]} ... 他 {len(category.files)-1}件", file=buf)
         
-        print("-" * 50)
-        print(f"📈 合計: {total_files}件のファイルをカテゴリ分けしました")
+        print("-" * 50, file=buf)
+        print(f"📈 合計: {total_files}件のファイルをカテゴリ分けしました", file=buf)
+        _write_stdout(buf)
 
     def _interactive_commit_process(self, categories: List[FileCategory], interactive: bool = True) -> List[Dict[str, Any]]:
         """対話的コミットプロセス"""
@@ -771,7 +1496,7 @@ class GitSmartAgent(GitAgent):
         print("💡 [Enter]=確定 / r=再生成 / e=編集 / s=スキップ / q=中止")
         
         # 優先度順にカテゴリ処理
-        for category in sorted(categories, key=lambda x: x.priority):
+        for category in categories:
             if not category.files:
                 continue
             
@@ -794,13 +1519,12 @@ class GitSmartAgent(GitAgent):
                 print(f"\n📄 [{i}/{len(category.files)}] {file_path}")
                 
                 # ファイル存在確認
-                full_path = self.project_root / file_path
-                if not full_path.exists():
+                if not os.path.exists(os.path.join(self._project_root_str, file_path)):
                     print("   ⚠️  ファイルが存在しません（削除されたファイル）")
                     if self._handle_deleted_file(file_path):
                         commit_results.append({
                             "file": file_path,
-                            "message": f":remove: {Path(file_path).name} 削除",
+                            "message": f":remove: {file_path.rsplit('/', 1)[-1]} 削除",
                             "success": True,
                             "category": category.name
                         })
@@ -811,17 +1535,19 @@ class GitSmartAgent(GitAgent):
                     print("   ❌ ステージング失敗")
                     continue
                 
-                # 差分取得
-                diff_content = self.get_file_diff(file_path, staged=True)
+                # 差分取得（巨大な差分は先頭だけ読む）
+                diff_content = self.get_file_diff(file_path, staged=True, max_bytes=_DIFF_MAX_BYTES)
                 if not diff_content:
                     print("   ⚠️  差分がありません - スキップ")
                     continue
                 
                 # 差分表示（簡潔版）
-                self._show_diff_summary(diff_content)
+                # （差分はここで1回だけ走査し、集計結果を以降の処理に渡す）
+                stats = _scan_diff(diff_content)
+                self._show_diff_summary(stats)
                 
                 # コミットメッセージ生成・対話
-                commit_result = self._interactive_commit_single_file(file_path, diff_content, category)
+                commit_result = self._interactive_commit_single_file(file_path, diff_content, category, stats)
                 if commit_result:
                     commit_results.append(commit_result)
                 
@@ -838,50 +1564,77 @@ class GitSmartAgent(GitAgent):
         """自動コミットプロセス（非対話モード）"""
         commit_results = []
         
-        for category in sorted(categories, key=lambda x: x.priority):
+        for category in categories:
             if not category.files:
                 continue
                 
             print(f"\n📁 {category.description} ({len(category.files)}件)")
             
-            for file_path in category.files:
-                full_path = self.project_root / file_path
-                if not full_path.exists():
-                    continue
-                
-                if self.stage_file(file_path):
-                    diff_content = self.get_file_diff(file_path, staged=True)
-                    if diff_content:
-                        message = self.generate_commit_message(file_path, diff_content)
-                        
-                        if self.commit_file(file_path, message):
-                            commit_results.append({
-                                "file": file_path,
-                                "message": message,
-                                "success": True,
-                                "category": category.name
-                            })
-                            print(f"   ✅ {file_path} → {message}")
-                        else:
-                            commit_results.append({
-                                "file": file_path,
-                                "message": message,
-                                "success": False,
-                                "category": category.name
-                            })
-                            print(f"   ❌ {file_path} → コミット失敗")
+            # カテゴリ内のファイルをまとめてステージングし、差分も1回で取得
+            # （削除済みファイルも git status に載っているので存在確認せずそのまま渡す）
+            files = category.files
+            if not self.stage_files(files):
+                continue
+            staged_diffs = self.get_all_staged_diffs()
+            targets = [(path, staged_diffs[path]) for path in files
+                       if path in staged_diffs and staged_diffs[path].diff]
+            if not targets:
+                continue
+            
+            # メッセージ生成はファイルごとに並列実行し、結果は元の順序で受け取る
+            # （遅延生成される履歴DB・LLMエージェントはスレッド投入前に初期化しておく）
+            _ = (self.history_manager, self.llm_agent)
+            with concurrent.futures.ThreadPoolExecutor(
+                    max_workers=min(_COMMIT_WORKERS, len(targets))) as executor:
+                jobs = [executor.submit(self._prepare_commit, file_path, file_diff)
+                        for file_path, file_diff in targets]
+                prepared = [job.result() for job in jobs]
+            
+            # 同じメッセージになったファイルは1回のコミットにまとめる
+            files_by_message: Dict[str, List[str]] = {}
+            for file_path, message in prepared:
+                files_by_message.setdefault(message, []).append(file_path)
+            
+            for message, message_files in files_by_message.items():
+                success = self.commit_files(message_files, message)
+                for file_path in message_files:
+                    commit_results.append({
+                        "file": file_path,
+                        "message": message,
+                        "success": success,
+                        "category": category.name
+                    })
+                    if success:
+                        print(f"   ✅ {file_path} → {message}")
+                    else:
+                        print(f"   ❌ {file_path} → コミット失敗")
         
         return commit_results
 
+    def _prepare_commit(self, file_path: str, file_diff) -> Tuple[str, str]:
+        """1ファイル分のコミットメッセージを生成（_auto_commit_process のワーカー）"""
+        message = self.generate_commit_message(
+            file_path, file_diff.diff,
+            diff_stats=(file_diff.added_lines, file_diff.removed_lines)
+        )
+        return file_path, message
+
+    def _cached_remote_status(self) -> Dict[str, Any]:
+        """check_remote_status の結果を _REMOTE_STATUS_TTL 秒間使い回す（対話モード用）"""
+        cache = self._remote_status_cache
+        now = time.monotonic()
+        if cache is not None and now - cache[0] < _REMOTE_STATUS_TTL:
+            return cache[1]
+        status = self.check_remote_status()
+        self._remote_status_cache = (now, status)
+        return status
+
     def _execute_push(self) -> Dict[str, Any]:
         try:
-            result = subprocess.run(
-                "git push",
-                shell=True,
-                capture_output=True,
-                text=True,
-                cwd=self.project_root
-            )
+            result = self._run_git(["push"])
+            if result.returncode == 0:
+                # ahead 数・push 可否が変わるので次回は取り直す
+                self._remote_status_cache = None
             
             return {
                 "success": result.returncode == 0,
@@ -941,7 +1694,7 @@ class GitSmartAgent(GitAgent):
                     self.smart_commit_workflow(auto_push=False, interactive=True)
                 
                 elif command == "push":
-                    remote_status = self.check_remote_status()
+                    remote_status = self._cached_remote_status()
                     if remote_status["has_remote"] and remote_status.get("can_push"):
                         result = self._execute_push()
                         if result["success"]:
@@ -952,7 +1705,7 @@ class GitSmartAgent(GitAgent):
                         print("⚠️  プッシュ不可: リモート未設定またはコミットなし")
                 
                 elif command == "remote":
-                    remote_status = self.check_remote_status()
+                    remote_status = self._cached_remote_status()
                     if remote_status["has_remote"]:
                         print("📡 リモート設定:")
                         for remote in remote_status["remotes"]:
@@ -1059,39 +1812,25 @@ class GitSmartAgent(GitAgent):
         # 以下にヘルパーメソッドを追加する場所を確保
         pass
 
-    def _show_diff_summary(self, diff_content: str):
+    def _show_diff_summary(self, stats: DiffStats):
         """差分サマリー表示"""
-        lines = diff_content.split('\n')
-        added_lines = len([l for l in lines if l.startswith('+')])
-        removed_lines = len([l for l in lines if l.startswith('-')])
-        
-        print(f"   📊 変更: +{added_lines} -{removed_lines} 行")
+        print(f"   📊 変更: +{stats.added} -{stats.removed} 行")
         
         # 重要な変更のプレビュー
-        important_changes = []
-        for line in lines[:20]:
-            if line.startswith('+') and not line.startswith('+++'):
-                clean_line = line[1:].strip()
-                if clean_line and not clean_line.startswith('#'):
-                    important_changes.append(f"   + {clean_line[:60]}")
-            elif line.startswith('-') and not line.startswith('---'):
-                clean_line = line[1:].strip()
-                if clean_line and not clean_line.startswith('#'):
-                    important_changes.append(f"   - {clean_line[:60]}")
-        
+        important_changes = stats.preview
         if important_changes:
             print("   🔍 主な変更:")
             for change in important_changes[:3]:
-                print(change)
+                print(f"   {change}")
             if len(important_changes) > 3:
                 print(f"   ... 他 {len(important_changes)-3}件の変更")
 
-    def _interactive_commit_single_file(self, file_path: str, diff_content: str, category: FileCategory) -> Optional[Dict[str, Any]]:
+    def _interactive_commit_single_file(self, file_path: str, diff_content: str, category: FileCategory, stats: DiffStats) -> Optional[Dict[str, Any]]:
         """単一ファイルの対話的コミット"""
         rejected_messages = []
         
         # 初回コミットメッセージ生成
-        message = self._generate_better_commit_message(file_path, diff_content, rejected_messages)
+        message = self._generate_better_commit_message(file_path, diff_content, stats, rejected_messages)
         
         while True:
             print(f"\n💬 コミットメッセージ案:")
@@ -1121,7 +1860,7 @@ class GitSmartAgent(GitAgent):
             elif action == "r":
                 # 再生成
                 rejected_messages.append(message)
-                new_message = self._generate_better_commit_message(file_path, diff_content, rejected_messages)
+                new_message = self._generate_better_commit_message(file_path, diff_content, stats, rejected_messages)
                 if new_message != message:
                     message = new_message
                 else:
@@ -1136,13 +1875,13 @@ class GitSmartAgent(GitAgent):
             elif action == "d":
                 # 詳細再生成
                 rejected_messages.append(message)
-                message = self._generate_detailed_commit_message(file_path, diff_content, rejected_messages)
+                message = self._generate_detailed_commit_message(file_path, diff_content, stats, rejected_messages)
             
             elif action == "s":
                 # スキップ
                 print(f"   ⏭️  スキップ: {file_path}")
                 # アンステージ
-                subprocess.run(f"git restore --staged -- {file_path}", shell=True, cwd=self.project_root)
+                self._run_git(["restore", "--staged", "--", file_path])
                 return None
             
             elif action == "h":
@@ -1157,25 +1896,23 @@ class GitSmartAgent(GitAgent):
             else:
                 print("❓ 無効な入力です。h でヘルプを表示")
 
-    def _generate_better_commit_message(self, file_path: str, diff_content: str, rejected_messages: List[str] = None) -> str:
+    def _generate_better_commit_message(self, file_path: str, diff_content: str, stats: DiffStats, rejected_messages: List[str] = None) -> str:
         """改良されたコミットメッセージ生成"""
         if rejected_messages is None:
             rejected_messages = []
         
-        # ファイル分析
-        path_obj = Path(file_path)
-        filename = path_obj.name
+        # 変更量・変更内容キーワードは走査済みの集計結果を使う
+        added_lines, removed_lines = stats.added, stats.removed
+        content_keywords = list(stats.keywords)
         
-        # 変更量分析
-        lines = diff_content.split('\n')
-        added_lines = len([l for l in lines if l.startswith('+') and not l.startswith('+++')])
-        removed_lines = len([l for l in lines if l.startswith('-') and not l.startswith('---')])
-        
-        # 変更内容キーワード分析
-        content_keywords = self._analyze_diff_keywords(diff_content)
+        # 同じ差分・同じ却下案なら前回の生成結果を使い回す
+        cache_key = ('better', file_path, stats.digest, tuple(rejected_messages[-3:]))
+        cached = self._llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         # LLMプロンプト構築
-        prompt = self._build_commit_prompt(file_path, diff_content, content_keywords, rejected_messages)
+        prompt = self._build_commit_prompt(file_path, diff_content, stats, rejected_messages)
         
         try:
             # LLMで生成
@@ -1196,6 +1933,7 @@ class GitSmartAgent(GitAgent):
                 message = self._clean_commit_message(message)
                 
                 if self._validate_commit_message(message):
+                    self._llm_cache[cache_key] = message
                     return message
                     
         except Exception as e:
@@ -1206,42 +1944,16 @@ class GitSmartAgent(GitAgent):
 
     def _analyze_diff_keywords(self, diff_content: str) -> List[str]:
         """差分からキーワード抽出"""
-        keywords = []
-        lines = diff_content.split('\n')
-        
-        for line in lines:
-            if line.startswith('+') and not line.startswith('+++'):
-                content = line[1:].strip()
-                
-                if 'def ' in content:
-                    keywords.append('関数追加')
-                elif 'class ' in content:
-                    keywords.append('クラス追加')
-                elif 'import ' in content:
-                    keywords.append('インポート追加')
-                elif any(word in content.lower() for word in ['config', '設定', 'setting']):
-                    keywords.append('設定変更')
-                elif any(word in content.lower() for word in ['test', 'テスト']):
-                    keywords.append('テスト')
-                elif any(word in content.lower() for word in ['fix', '修正', 'bug']):
-                    keywords.append('バグ修正')
-                elif any(word in content.lower() for word in ['add', '追加', 'new']):
-                    keywords.append('機能追加')
-                elif any(word in content.lower() for word in ['readme', 'doc', 'ドキュメント']):
-                    keywords.append('ドキュメント')
-        
-        return list(set(keywords))
-
-    def _build_commit_prompt(self, file_path: str, diff_content: str, keywords: List[str], rejected_messages: List[str]) -> str:
+        return list(_scan_diff(diff_content).keywords)
+
+    def _build_commit_prompt(self, file_path: str, diff_content: str, stats: DiffStats, rejected_messages: List[str]) -> str:
         """コミットメッセージ生成プロンプト構築"""
-        lines = diff_content.split('\n')
-        added_lines = len([l for l in lines if l.startswith('+') and not l.startswith('+++')])
-        removed_lines = len([l for l in lines if l.startswith('-') and not l.startswith('---')])
+        keywords = stats.keywords
         
         prompt = f"""以下のファイル変更から具体的なコミットメッセージを生成してください。
 
 ファイルパス: {file_path}
-変更量: +{added_lines} -{removed_lines} 行
+変更量: +{stats.added} -{stats.removed} 行
 検出キーワード: {', '.join(keywords) if keywords else 'なし'}
 
 必須要件:
@@ -1263,33 +1975,27 @@ class GitSmartAgent(GitAgent):
 
     def _clean_commit_message(self, message: str) -> str:
         """コミットメッセージのクリーニング"""
-        import re
-        
         # 絵文字削除
-        emoji_pattern = re.compile("[\U0001F600-\U0001F64F\U0001F300-\U0001F5FF\U0001F680-\U0001F6FF\U0001F1E0-\U0001F1FF\U00002702-\U000027B0\U000024C2-\U0001F251]+")
-        message = emoji_pattern.sub('', message)
+        message = _EMOJI_RE.sub('', message)
         
         # 余分な文字削除
-        message = re.sub(r'[*`]', '', message)
-        message = re.sub(r'\s+', ' ', message)
+        message = _MD_PUNCT_RE.sub('', message)
+        message = _WS_RE.sub(' ', message)
         message = message.strip('- ')
         
         return message.strip()
 
     def _validate_commit_message(self, message: str) -> bool:
         """コミットメッセージ検証"""
-        if not message or len(message) < 10 or len(message) > 120:
+        if not 10 <= len(message) <= 120:
             return False
         
-        if not message.startswith(':'):
-            return False
-        
-        valid_prefixes = [':add:', ':fix:', ':update:', ':refactor:', ':docs:', ':test:', ':config:', ':remove:']
-        return any(message.startswith(prefix) for prefix in valid_prefixes)
+        return _VALID_PREFIX_RE.match(message) is not None
 
     def _generate_rule_based_message(self, file_path: str, added_lines: int, removed_lines: int, keywords: List[str]) -> str:
         """ルールベースコミットメッセージ生成"""
-        filename = Path(file_path).name
+        # git のパスは常に '/' 区切りなので Path を組み立てない
+        filename = file_path.rsplit('/', 1)[-1]
         
         # prefix決定
         if added_lines > removed_lines * 2:
@@ -1298,9 +2004,9 @@ class GitSmartAgent(GitAgent):
             prefix = ":fix:"
         elif 'テスト' in keywords:
             prefix = ":test:"
-        elif 'ドキュメント' in keywords or filename.endswith('.md'):
+        elif 'ドキュメント' in keywords or file_path.endswith('.md'):
             prefix = ":docs:"
-        elif '設定変更' in keywords or filename.endswith(('.yaml', '.yml', '.json')):
+        elif '設定変更' in keywords or file_path.endswith(('.yaml', '.yml', '.json')):
             prefix = ":config:"
         else:
             prefix = ":update:"
@@ -1313,8 +2019,13 @@ class GitSmartAgent(GitAgent):
         
         return f"{prefix} {description}"
 
-    def _generate_detailed_commit_message(self, file_path: str, diff_content: str, rejected_messages: List[str]) -> str:
+    def _generate_detailed_commit_message(self, file_path: str, diff_content: str, stats: DiffStats, rejected_messages: List[str]) -> str:
         """詳細コミットメッセージ生成"""
+        cache_key = ('detailed', file_path, stats.digest, tuple(rejected_messages[-3:]))
+        cached = self._llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         prompt = f"""以下のファイル変更について、開発者が理解しやすい詳細なコミットメッセージを生成してください。
 
 ファイル: {file_path}
@@ -1348,19 +2059,17 @@ class GitSmartAgent(GitAgent):
             if response.is_success and response.content:
                 message = self._clean_commit_message(response.content.strip())
                 if self._validate_commit_message(message):
+                    self._llm_cache[cache_key] = message
                     return message
         except Exception:
             pass
         
-        return self._generate_better_commit_message(file_path, diff_content, rejected_messages)
+        return self._generate_better_commit_message(file_path, diff_content, stats, rejected_messages)
 
     def _handle_deleted_file(self, file_path: str) -> bool:
         """削除ファイルの処理"""
         try:
-            result = subprocess.run(
-                f"git rm -- {file_path}",
-                shell=True, capture_output=True, text=True, cwd=self.project_root
-            )
+            result = self._run_git(["rm", "--", file_path])
             return result.returncode == 0
         except:
             return False
@@ -1407,10 +2116,12 @@ def main():
     parser.add_argument("--cleanup", action="store_true", help="ファイル整理のみ")
     parser.add_argument("--analyze", action="store_true", help="ファイル分析のみ")
     parser.add_argument("--interactive", action="store_true", help="対話モード")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="大規模リポジトリでのファイル分類に使うプロセス数（既定: CPU数、1で無効）")
     
     args = parser.parse_args()
     
-    agent = GitSmartAgent()
+    agent = GitSmartAgent(jobs=args.jobs)
     
     if args.analyze:
         categories = agent.analyze_files()
@@ -23,6 +23,7 @@ from services.llm.llm_common import (
     get_prompt_template,
     get_system_message,
     get_api_defaults,
+    count_diff_lines,
     LLMResponse
 )
 from services.llm.provider_gemini import GeminiConfig
@@ -293,9 +294,8 @@ class LLMAgent:
 
         # 差分サイズ調整
         if len(diff_content) > 2000:
-            lines = diff_content.split('\n')
-            added = len([l for l in lines if l.startswith('+')])
-            removed = len([l for l in lines if l.startswith('-')])
+            added, removed = count_diff_lines(diff_content)
+            lines = diff_content.split('\n', 20)
             diff_content = f"Large diff: +{added} -{removed} lines\n" + '\n'.join(lines[:20])
 
         full_prompt = f"{prompt}\n\n==== 対象ファイル ====\n{file_path}\n\n==== 差分 ====\n{diff_content}"
@@ -323,9 +323,7 @@ class LLMAgent:
         """スマートデフォルトメッセージ"""
         filename = Path(file_path).name
 
-        lines = diff_content.split('\n')
-        added = len([l for l in lines if l.startswith('+')])
-        removed = len([l for l in lines if l.startswith('-')])
+        added, removed = count_diff_lines(diff_content)
 
         if added > removed * 2:
             prefix = ":add:"
@@ -132,6 +132,78 @@ class LLMHistoryManager:
 
         return self.crud.insert("command_history", data)
 
+    def log_command_executions(self, records: List[Dict[str, Any]]) -> int:
+        """コマンド実行履歴をまとめてログに記録（1トランザクション）
+
+        records の各要素は log_command_execution と同じキーを持つ辞書。
+        """
+
+        now = datetime.now().isoformat()
+        rows = [
+            {
+                "session_id": self.current_session_id,
+                "command_line": record["command_line"],
+                "working_directory": record.get("working_directory"),
+                "exit_code": record.get("exit_code"),
+                "stdout_text": record.get("stdout_text", ""),
+                "stderr_text": record.get("stderr_text", ""),
+                "execution_time_ms": record.get("execution_time_ms"),
+                "user_id": record.get("user_id"),
+                "context_info": json.dumps(record.get("context_info") or {}, ensure_ascii=False),
+                "timestamp": record.get("timestamp") or now
+            }
+            for record in records
+        ]
+
+        return self.crud.bulk_insert("command_history", rows)
+
+    def get_cached(self, prompt_hash: str, model: str, ttl_days: int = 7) -> Optional[str]:
+        """TTL内のキャッシュ済みレスポンスを取得（無ければ None）"""
+
+        sql = """
+        SELECT response_text FROM llm_response_cache
+        WHERE prompt_hash = ? AND model_name = ?
+          AND created_at >= datetime('now', ?)
+        """
+        rows = self.crud.execute_sql(sql, [prompt_hash, model, f"-{int(ttl_days)} days"])
+        if not rows:
+            return None
+
+        self.crud.execute_sql(
+            "UPDATE llm_response_cache SET hit_count = hit_count + 1 "
+            "WHERE prompt_hash = ? AND model_name = ?",
+            [prompt_hash, model]
+        )
+        return rows[0]["response_text"]
+
+    def put_cached(self,
+                   prompt_hash: str,
+                   model: str,
+                   response_text: str,
+                   provider: str = None,
+                   ttl_days: int = 7) -> None:
+        """レスポンスをキャッシュに保存（同一キーは上書き）"""
+
+        self.crud.upsert("llm_response_cache", {
+            "prompt_hash": prompt_hash,
+            "model_name": model,
+            "provider": provider,
+            "response_text": response_text,
+            "hit_count": 0,
+            "ttl_days": ttl_days,
+            "created_at": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        }, ["prompt_hash", "model_name"])
+
+    def clear_cache(self, expired_only: bool = False) -> int:
+        """レスポンスキャッシュを削除（expired_only=True ならTTL切れのみ）"""
+
+        if expired_only:
+            return self.crud.delete_where(
+                "llm_response_cache",
+                ("created_at < datetime('now', '-' || ttl_days || ' days')", [])
+            )
+        return self.crud.delete_where("llm_response_cache", None)
+
     def search_llm_history(self,
                           query: str = None,
                           provider: str = None,
@@ -265,6 +337,32 @@ class LLMHistoryManager:
 
         return self.crud.execute_sql(sql)
 
+    def get_provider_scores(self, days: int = 7) -> List[Dict[str, Any]]:
+        """プロバイダー別の成功率・平均応答時間・性能スコアを取得（スコア降順）
+
+        性能スコア = 成功率 * 0.7 + 1 / (1 + 平均応答秒) * 0.3
+        """
+
+        sql = """
+        SELECT provider,
+               total_requests,
+               success_rate,
+               avg_response_time,
+               success_rate * 0.7 + (1.0 / (1.0 + avg_response_time / 1000.0)) * 0.3 AS performance_score
+        FROM (
+            SELECT provider,
+                   COUNT(*) AS total_requests,
+                   SUM(CASE WHEN success = 1 THEN 1 ELSE 0 END) * 1.0 / COUNT(*) AS success_rate,
+                   COALESCE(AVG(response_time_ms), 0) AS avg_response_time
+            FROM llm_history
+            WHERE timestamp >= datetime('now', ?)
+            GROUP BY provider
+        )
+        ORDER BY performance_score DESC, total_requests DESC
+        """
+
+        return self.crud.execute_sql(sql, [f"-{int(days)} days"])
+
     def export_session_report(self, session_id: str, format: str = "json") -> str:
         """セッションレポートを出力"""
 
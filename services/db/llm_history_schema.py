@@ -63,6 +63,19 @@ LLM_HISTORY_SCHEMA = {
         created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
         updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
     )
+    """,
+
+    "llm_response_cache": """
+    CREATE TABLE IF NOT EXISTS llm_response_cache (
+        prompt_hash TEXT NOT NULL,   -- SHA-256(正規化したリクエスト)
+        model_name TEXT NOT NULL,
+        provider TEXT,
+        response_text TEXT NOT NULL,
+        hit_count INTEGER DEFAULT 0,
+        ttl_days INTEGER DEFAULT 7,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (prompt_hash, model_name)
+    )
     """
 }
 
@@ -83,6 +96,9 @@ LLM_HISTORY_INDICES = {
     "llm_sessions": [
         "CREATE INDEX IF NOT EXISTS idx_llm_sessions_start_time ON llm_sessions(start_time)",
         "CREATE INDEX IF NOT EXISTS idx_llm_sessions_type ON llm_sessions(session_type)",
+    ],
+    "llm_response_cache": [
+        "CREATE INDEX IF NOT EXISTS idx_llm_response_cache_created ON llm_response_cache(created_at)",
     ]
 }
 
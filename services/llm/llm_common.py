@@ -7,12 +7,20 @@ services/llm/llm_common.py
 """
 from __future__ import annotations
 import os
+import re
+import sys
 import json
 import time
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, Optional, Tuple
 from dataclasses import dataclass, field
 
+# orjson があれば CLI の JSON 出力に使用
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
 # プロジェクトルートを基点に固定
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 CONFIG_DIR = PROJECT_ROOT / "config"
@@ -45,6 +53,14 @@ def load_env_from_config(debug: bool = False) -> None:
             print(f"[llm_common] .env not found: {ENV_FILE}", flush=True)
 
 
+# ==========================================================
+# YAML ローダー選択
+# ==========================================================
+def _yaml_loader(yaml):
+    """libyaml (C拡張) の CSafeLoader があれば使用し、無ければ SafeLoader。"""
+    return getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
 # ==========================================================
 # プロンプトテンプレート読み込み
 # ==========================================================
@@ -56,7 +72,7 @@ def load_prompt_templates(path: Path | None = None) -> Dict[str, Any]:
         return {}
     try:
         with p.open("r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or {}
+            return yaml.load(f, Loader=_yaml_loader(yaml)) or {}
     except Exception as e:
         print(f"[llm_common] warn: failed to read prompt templates: {e}", flush=True)
         return {}
@@ -109,7 +125,7 @@ def load_config(path: Path | None = None) -> Dict[str, Any]:
         return {}
     try:
         with p.open("r", encoding="utf-8") as f:
-            return yaml.safe_load(f) or {}
+            return yaml.load(f, Loader=_yaml_loader(yaml)) or {}
     except Exception as e:
         print(f"[llm_common] warn: failed to read yaml: {e}", flush=True)
         return {}
@@ -392,6 +408,21 @@ def get_llm_model_from_config(cfg: Dict[str, Any], provider: str, default_model:
         return default_model
 
 
+# ==========================================================
+# 差分の行数集計（共通）
+# ==========================================================
+# ファイル見出しの "--- a/..." / "+++ b/..." 行の組
+_DIFF_FILE_HEADER_RE = re.compile(r'^--- .*\n\+\+\+ ', re.MULTILINE)
+
+
+def count_diff_lines(diff_content: str) -> Tuple[int, int]:
+    """'+' / '-' で始まる行数を行分割せずに数える（ファイル見出し行は除外）"""
+    headers = len(_DIFF_FILE_HEADER_RE.findall(diff_content))
+    added = diff_content.count('\n+') + diff_content.startswith('+') - headers
+    removed = diff_content.count('\n-') + diff_content.startswith('-') - headers
+    return added, removed
+
+
 # ==========================================================
 # オプション解析（共通）
 # ==========================================================
@@ -464,6 +495,21 @@ def check_environment() -> Dict[str, Any]:
     return env_status
 
 
+def print_json(obj: Any) -> None:
+    """JSONを標準出力へ出力（orjson があればバイト列のまま書き込む）"""
+    if _orjson is not None:
+        try:
+            data = _orjson.dumps(obj, option=_orjson.OPT_INDENT_2 | _orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            data = None
+        if data is not None:
+            sys.stdout.flush()
+            sys.stdout.buffer.write(data + b"\n")
+            sys.stdout.buffer.flush()
+            return
+    print(json.dumps(obj, ensure_ascii=False, indent=2))
+
+
 def print_environment_status(debug: bool = False) -> None:
     """
     環境状態を表示する
@@ -1,6 +1,12 @@
+import sys
 from pathlib import Path
 import yaml
 
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from agents.config_agent import _emit_llm_config_fast
+
 CFG = Path("config/config.yaml")
 
 def test_config_exists():
@@ -10,3 +16,41 @@ def test_config_parse_yaml():
     data = yaml.safe_load(CFG.read_text(encoding="utf-8"))
     assert isinstance(data, dict)
     assert "llm" in data
+
+
+def test_fast_llm_config_emitter_round_trips():
+    cfg = {
+        "llm": {
+            "default_provider": "gemini",
+            "providers": {
+                "gemini": {
+                    "base_url": "https://generativelanguage.googleapis.com/v1beta",
+                    "model": "models/gemini-1.5:latest",
+                    "api_key": None,
+                    "enabled": True,
+                    "max_tokens": 4096,
+                    "temperature": 0.7,
+                    "top_p": 1e-05,
+                    "scale": 1e+20,
+                },
+                "ollama": {"host": "http://localhost:11434", "models": ["a:b", "llama3"]},
+            },
+            "reserved": ["Yes", "off", "No", "ON", "y", "Null", "true"],
+            "text": {
+                "japanese": "日本語のプロンプト",
+                "multiline": "1行目\n2行目\n",
+                "spaces": " leading and trailing ",
+                "colon": "key: value",
+                "comment": "# not a comment",
+                "numeric": "1.0",
+                "separators": "a\u2028b\u2029c\x85d",
+                "control": "tab\tdel\x7f",
+                "empty": "",
+            },
+            "empty_list": [],
+            "empty_dict": {},
+        }
+    }
+    text = _emit_llm_config_fast(cfg)
+    assert text is not None
+    assert yaml.safe_load(text) == cfg
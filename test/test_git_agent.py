@@ -0,0 +1,127 @@
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from agents.git_agent import _GitWorker
+from agents.git_smart_agent import GitSmartAgent
+
+
+def _git(repo: Path, *args: str) -> None:
+    subprocess.run(["git", *args], cwd=repo, check=True, capture_output=True)
+
+
+def _make_repo(tmp_path: Path) -> Path:
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git(repo, "init", "-q")
+    _git(repo, "config", "user.email", "test@example.com")
+    _git(repo, "config", "user.name", "test")
+    return repo
+
+
+def _smart_agent(repo: Path) -> GitSmartAgent:
+    """一時リポジトリを対象にした GitSmartAgent"""
+    agent = GitSmartAgent()
+    agent.project_root = repo
+    agent._project_root_str = str(repo)
+    agent._git_worker = _GitWorker(repo)
+    return agent
+
+
+def test_large_staged_diff_is_capped_quickly(tmp_path):
+    repo = _make_repo(tmp_path)
+    big = repo / "generated.txt"
+    big.write_text("".join(f"{i} generated line\n" for i in range(200000)))
+    _git(repo, "add", "generated.txt")
+    _git(repo, "commit", "-q", "-m", "init")
+    big.write_text("".join(f"{i} generated {'LINE' if i % 7 == 0 else 'line'}\n" for i in range(200000)))
+    _git(repo, "add", "generated.txt")
+
+    agent = _smart_agent(repo)
+    try:
+        start = time.monotonic()
+        diff = agent.get_file_diff("generated.txt", max_bytes=65536)
+        elapsed = time.monotonic() - start
+    finally:
+        agent.close()
+
+    assert diff.startswith("diff --git a/generated.txt b/generated.txt\n")
+    assert 0 < len(diff.encode("utf-8")) <= 65536
+    assert diff.endswith("\n"), "途中までの行が残っています"
+    assert elapsed < 10, f"巨大な差分の取得に {elapsed:.1f} 秒かかりました"
+
+
+def test_all_staged_diffs_pair_each_file_with_its_patch(tmp_path):
+    repo = _make_repo(tmp_path)
+    (repo / "old name.txt").write_text("".join(f"line {i}\n" for i in range(20)))
+    (repo / "run.sh").write_text("echo run\n")
+    (repo / "image.bin").write_bytes(b"\x00\x01\x02")
+    (repo / "notes with space.txt").write_text("first\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "init")
+
+    _git(repo, "mv", "old name.txt", "new name.txt")
+    (repo / "new name.txt").write_text("".join(f"line {i}\n" for i in range(20)) + "added\n")
+    (repo / "run.sh").chmod(0o755)
+    (repo / "image.bin").write_bytes(b"\x00\x03\x04\x05")
+    (repo / "notes with space.txt").write_text("first\nsecond\nthird\n")
+    _git(repo, "add", "-A")
+
+    agent = _smart_agent(repo)
+    try:
+        diffs = agent.get_all_staged_diffs()
+    finally:
+        agent.close()
+
+    assert set(diffs) == {"new name.txt", "run.sh", "image.bin", "notes with space.txt"}
+
+    renamed = diffs["new name.txt"]
+    assert renamed.diff.startswith("diff --git a/old name.txt b/new name.txt\n")
+    assert "rename to new name.txt" in renamed.diff
+    assert (renamed.added_lines, renamed.removed_lines) == (1, 0)
+
+    mode_only = diffs["run.sh"]
+    assert mode_only.diff.startswith("diff --git a/run.sh b/run.sh\n")
+    assert "new mode 100755" in mode_only.diff
+    assert (mode_only.added_lines, mode_only.removed_lines) == (0, 0)
+
+    binary = diffs["image.bin"]
+    assert binary.diff.startswith("diff --git a/image.bin b/image.bin\n")
+    assert "Binary files" in binary.diff
+    assert (binary.added_lines, binary.removed_lines) == (0, 0)
+
+    spaced = diffs["notes with space.txt"]
+    assert spaced.diff.startswith("diff --git a/notes with space.txt b/notes with space.txt\n")
+    assert (spaced.added_lines, spaced.removed_lines) == (2, 0)
+
+
+def test_all_staged_diffs_keep_order_with_unmerged_path(tmp_path):
+    repo = _make_repo(tmp_path)
+    (repo / "a.txt").write_text("a\n")
+    (repo / "z.txt").write_text("base\n")
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "init")
+    _git(repo, "checkout", "-q", "-b", "other")
+    (repo / "z.txt").write_text("other\n")
+    _git(repo, "commit", "-q", "-am", "other")
+    _git(repo, "checkout", "-q", "-")
+    (repo / "z.txt").write_text("main\n")
+    _git(repo, "commit", "-q", "-am", "main")
+    subprocess.run(["git", "merge", "-q", "other"], cwd=repo, capture_output=True)
+    (repo / "a.txt").write_text("a\nb\n")
+    _git(repo, "add", "a.txt")
+
+    agent = _smart_agent(repo)
+    try:
+        diffs = agent.get_all_staged_diffs()
+    finally:
+        agent.close()
+
+    assert diffs["a.txt"].diff.startswith("diff --git a/a.txt b/a.txt\n")
+    assert "Unmerged" not in diffs["a.txt"].diff
+    assert (diffs["a.txt"].added_lines, diffs["a.txt"].removed_lines) == (1, 0)
+    assert diffs["z.txt"].diff.startswith("* Unmerged path z.txt")